@@ -7,8 +7,6 @@ export default function GameWrapper({ gameId, GameRenderer, gameConfig = {}, })
   const [model, setModel] = useState(null);
   const [resetRequired, setResetRequired] = useState(false);
 
-  const { hasHouseTurn = false } = gameConfig;
-
   // --- Start game ---
   useEffect(() => {
     async function start() {
@@ -29,19 +27,9 @@ export default function GameWrapper({ gameId, GameRenderer, gameConfig = {}, })
     if (!model || model.gameover || resetRequired) return;
 
     try {
-      const next = await GameAPI.update(gameId, model, action);
-      setModel(next);
-
-      // Auto house turn
-      if (
-        hasHouseTurn &&
-        !next.wrong &&
-        !next.illegal &&
-        !next.gameover
-      ) {
-        const house = await GameAPI.houseTurn(gameId, next);
-        setModel(house);
-      }
+      // server plays the house turn (if hasHouseTurn) in the same request
+      const { state } = await GameAPI.actions(gameId, [action]);
+      setModel(state);
     } catch (err) {
       if (err.code === 409) {
         // epoch conflict / game reset
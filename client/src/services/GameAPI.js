@@ -28,20 +28,34 @@ const GameAPI = {
     return request(`${BASE}/${gameId}/start`);
   },
 
-  update(gameId, state, action) {
+  // server loads the player's state itself, so only send the action
+  update(gameId, action) {
     return request(`${BASE}/${gameId}/update`, {
       method: "POST",
-      body: JSON.stringify({ state, action }),
+      body: JSON.stringify({ action }),
+    });
+  },
+
+  // player actions + house replies in 1 request; returns { state, steps }
+  actions(gameId, actions) {
+    return request(`${BASE}/${gameId}/actions`, {
+      method: "POST",
+      body: JSON.stringify({ actions }),
     });
   },
 
   // optional
-  houseTurn(gameId, state) {
+  houseTurn(gameId) {
     return request(`${BASE}/${gameId}/house_turn`, {
       method: "POST",
-      body: JSON.stringify({ state }),
+      body: JSON.stringify({}),
     });
   },
+
+  // live top K + player's rank & neighbours
+  leaderboard(gameId, top = 10, around = 2) {
+    return request(`${BASE}/${gameId}/leaderboard?top=${top}&around=${around}`);
+  },
 };
 
 
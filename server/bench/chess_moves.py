@@ -0,0 +1,74 @@
+'''
+Moves/sec of ChessPuzzleEngine:
+answer key vs python-chess path w/ and w/o the position cache.
+
+Run from server/:
+    python -m bench.chess_moves
+'''
+import asyncio
+from fakeredis import FakeAsyncRedis
+from timeit import timeit
+
+from src.engines.chess_puzzle import ChessPuzzleEngine
+
+
+N = 20_000
+
+PUZZLE = {
+    'fen': '4r1k1/5ppp/8/8/8/7P/5PP1/6K1 b - - 1 1',
+    'solution': ['e8e1', 'g1h2', 'e1e2'],
+    'rating': 1500
+}
+
+
+async def fetcher(epoch):
+    return PUZZLE
+
+
+async def make_engine() -> ChessPuzzleEngine:
+    # resets go thru redis (published epoch data + checkpoint)
+    engine = ChessPuzzleEngine('chess_puzzle', FakeAsyncRedis(), None, fetcher)
+    await engine.ensure_reset('bench')
+    await engine.wait_persisted()
+    return engine
+
+
+def main():
+    engine = asyncio.run(make_engine())
+
+    state = engine.init_state()
+    correct = {'move': PUZZLE['solution'][0]}
+    wrong = {'move': 'g8h8'}
+    after = engine.update_state(state, correct)
+
+    # (fast, slow) per case
+    cases = {
+        'correct move': (lambda: engine.update_state(state, correct),
+                         lambda: engine._update_board(state, correct)),
+        'wrong move': (lambda: engine.update_state(state, wrong),
+                       lambda: engine._update_board(state, wrong)),
+        'house turn': (lambda: engine.play_house_turn(after),
+                       lambda: engine._play_house_turn_board(after)),
+    }
+
+    def rate(f):
+        return N / timeit(f, number=N)
+
+    print(f'{"case":<12} {"answer key/s":>14} {"cached/s":>12} {"uncached/s":>12}')
+    for name, (fast, slow) in cases.items():
+        # wrong moves miss the answer key, so fast == cached
+        key_rate = rate(fast)
+        cached_rate = rate(slow)
+
+        maxsize, engine.positions.maxsize = engine.positions.maxsize, 0
+        engine.positions.clear()
+        uncached_rate = rate(slow)
+        engine.positions.maxsize = maxsize
+
+        print(f'{name:<12} {key_rate:>14,.0f} {cached_rate:>12,.0f} {uncached_rate:>12,.0f}')
+
+    print('position cache:', engine.positions.stats())
+
+
+if __name__ == '__main__':
+    main()
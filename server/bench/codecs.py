@@ -0,0 +1,57 @@
+'''
+Compares state codecs: bytes stored in redis + encode/decode time.
+
+Run from server/:
+    python -m bench.codecs
+'''
+import json
+from timeit import timeit
+
+from src.services.codec import JSONCodec, MsgpackCodec
+from src.engines.chess_puzzle import ChessPuzzleEngine
+
+
+N = 100_000
+
+STATE = {
+    "piece": "b",
+    "rating": 1967,
+    "fen": "6k1/5ppp/8/8/8/7P/5PP1/4r1K1 w - - 2 2",
+    "ply": 1,
+    "score": 1,
+    "gameover": False
+}
+WRONG_STATE = {**STATE, "wrong": True}
+
+
+# json.dumps/loads is what GameStateStore used before codecs
+class LegacyJSON:
+    def encode(self, obj):
+        return json.dumps(obj)
+
+    def decode(self, raw):
+        return json.loads(raw)
+
+
+CODECS = {
+    'legacy json': LegacyJSON(),
+    'compact json': JSONCodec(),
+    'msgpack schema': ChessPuzzleEngine.codec,
+    'msgpack no schema': MsgpackCodec(()),
+}
+
+
+def main():
+    print(f'{"codec":<18} {"state":<6} {"bytes":>6} {"enc us":>8} {"dec us":>8}')
+    for name, codec in CODECS.items():
+        for label, state in (('plain', STATE), ('flag', WRONG_STATE)):
+            raw = codec.encode(state)
+            assert codec.decode(raw) == state
+
+            enc = timeit(lambda: codec.encode(state), number=N) / N * 1e6
+            dec = timeit(lambda: codec.decode(raw), number=N) / N * 1e6
+            print(f'{name:<18} {label:<6} {len(raw):>6} {enc:>8.2f} {dec:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+'''
+Measures the import cost of each registered engine + its provider,
+i.e. what a worker pays at startup for every game enabled in game_reg.json.
+Each is imported in a fresh interpreter, on top of the registry itself.
+
+Run from server/:
+    python -m bench.engine_imports
+'''
+import json
+import subprocess
+import sys
+
+from src.depends.engine_reg import ENGINES
+
+
+# prints (secs, RSS in KiB) after importing the targets
+PROBE = '''
+import resource, sys, time
+from src.depends.engine_reg import resolve
+t = time.perf_counter()
+for target in sys.argv[1:]:
+    resolve(target)
+print(time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+
+def probe(*targets: str) -> tuple[float, int]:
+    out = subprocess.run([sys.executable, '-c', PROBE, *targets],
+                         capture_output=True, text=True, check=True).stdout
+    secs, rss = out.split()
+    return float(secs), int(rss)
+
+
+if __name__ == '__main__':
+    _, base_rss = probe()
+    print(f'{"registry only":<16} {0:>8.1f} ms {base_rss / 1024:>8.1f} MiB')
+    for game_id, spec in ENGINES.items():
+        targets = [t for t in (spec['engine'], spec['provider']) if t]
+        secs, rss = probe(*targets)
+        print(f'{game_id:<16} {secs * 1000:>8.1f} ms {(rss - base_rss) / 1024:>+8.1f} MiB'
+              f'  {json.dumps(targets)}')
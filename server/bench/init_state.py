@@ -0,0 +1,58 @@
+'''
+Compares /start's work per new player: building, encoding and
+rendering the init state vs reusing the epoch's InitState.
+
+Run from server/:
+    python -m bench.init_state
+'''
+import asyncio
+from fakeredis import FakeAsyncRedis
+import json
+from timeit import timeit
+
+from src.engines.chess_puzzle import ChessPuzzleEngine
+from src.engines.minesweeper import MinesweeperEngine
+
+
+N = 100_000
+
+PUZZLE = {
+    'fen': '4r1k1/5ppp/8/8/8/7P/5PP1/6K1 b - - 1 1',
+    'solution': ['e8e1', 'g1h2', 'e1e2'],
+    'rating': 1500
+}
+
+
+async def fetcher(epoch):
+    return PUZZLE
+
+
+async def make_engines() -> list:
+    redis = FakeAsyncRedis()
+    engines = [ChessPuzzleEngine('chess_puzzle', redis, None, fetcher),
+               MinesweeperEngine('minesweeper', redis, None)]
+    for engine in engines:
+        await engine.ensure_reset('2026-01-01')
+        await engine.wait_persisted()
+    return engines
+
+
+def per_player(engine):
+    # before: init_state() -> codec for redis -> render + json for the response
+    state = engine.init_state()
+    engine.codec.encode(state)
+    json.dumps(engine.render(state))
+
+
+def shared(engine):
+    initial = engine.initial
+    return initial.ref, initial.body
+
+
+if __name__ == '__main__':
+    for engine in asyncio.run(make_engines()):
+        before = timeit(lambda: per_player(engine), number=N) / N * 1e6
+        after = timeit(lambda: shared(engine), number=N) / N * 1e6
+        stored = len(engine.codec.encode(engine.init_state()))
+        print(f'{engine._game_id:<14} {before:>7.2f} -> {after:.2f} us/player, '
+              f'redis value {stored} -> {len(engine.initial.ref)} bytes')
@@ -0,0 +1,60 @@
+'''
+Reveals/sec of MinesweeperEngine:
+precomputed zero-region masks vs BFS flood fill, across board sizes.
+
+Run from server/:
+    python -m bench.minesweeper
+'''
+from time import perf_counter
+from timeit import timeit
+
+import numpy as np
+
+from src.engines.minesweeper import MinesweeperEngine
+
+
+# (ndim, nmines); ~12-16% mines like the default 8x8 w/ 10
+BOARDS = ((8, 10), (16, 40), (32, 120), (64, 500), (128, 2000), (256, 8000))
+N = 2000
+
+
+def main():
+    print(f'{"board":<9} {"regions":>8} {"setup ms":>9} {"zero mask/s":>12} '
+          f'{"zero bfs/s":>11} {"update/s":>10}')
+    for ndim, nmines in BOARDS:
+        engine = MinesweeperEngine('minesweeper', None, None, ndim=ndim, nmines=nmines)
+        mines = engine.init_mines('bench')
+
+        t = perf_counter()
+        engine.apply_epoch({'mines': mines})
+        setup = perf_counter() - t
+
+        # clicks on zero tiles are the ones that flood fill
+        zeros = np.flatnonzero((engine.counts == 0) & ~engine.mines).tolist()
+        if not zeros:
+            continue
+        tiles = [zeros[i % len(zeros)] for i in range(N)]
+
+        def masks():
+            for tile in tiles:
+                engine._reveal(tile)
+
+        def bfs():
+            for tile in tiles[:N // 10]:
+                engine._flood_fill(tile)
+
+        state = engine.init_state()
+        def updates():
+            for tile in tiles:
+                engine.update_state(state, {'reveal': tile})
+
+        mask_rate = N / timeit(masks, number=1)
+        bfs_rate = (N // 10) / timeit(bfs, number=1)
+        update_rate = N / timeit(updates, number=1)
+
+        print(f'{f"{ndim}x{ndim}":<9} {len(engine.region_masks):>8} {setup * 1e3:>9.1f} '
+              f'{mask_rate:>12,.0f} {bfs_rate:>11,.0f} {update_rate:>10,.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+'''
+Latency of 1 chess turn (player move + house reply):
+REST (/update then /house_turn) vs the /ws channel.
+
+In-process w/ fakeredis + the test puzzle corpus, so this only measures
+server overhead per turn; a real redis adds network round trips,
+of which the REST flow does more.
+
+Run from server/:
+    python -m bench.ws_vs_rest
+'''
+import json
+import os
+from pathlib import Path
+from statistics import median
+from time import perf_counter
+
+os.environ.setdefault('PUZZLE_CORPUS',
+                      str(Path(__file__).parents[1] / 'tests' / 'data' / 'puzzles.csv'))
+
+from fakeredis import FakeAsyncRedis
+from httpx import AsyncClient
+from starlette.testclient import TestClient
+
+from src.main import app
+
+
+N = 300
+MOVE = {'move': 'e8e1'}  # 1st move of the test puzzle; house replies g1h2
+
+
+class NoDB:
+    # nothing is persisted during the bench
+    async def dispose(self):
+        pass
+
+
+def rest_turn(client: TestClient) -> float:
+    t = perf_counter()
+    state = client.post('/games/chess_puzzle/update', json={'action': MOVE}).json()
+    assert state['ply'] == 1
+    state = client.post('/games/chess_puzzle/house_turn', json={}).json()
+    assert state['ply'] == 2
+    return perf_counter() - t
+
+
+def ws_turn(ws) -> float:
+    t = perf_counter()
+    ws.send_json({'type': 'update', 'action': MOVE})
+    assert ws.receive_json()['state']['ply'] == 1
+    assert ws.receive_json()['state']['ply'] == 2
+    return perf_counter() - t
+
+
+def main():
+    app.state.redis = FakeAsyncRedis()
+    app.state.http = AsyncClient()
+    app.state.db_engine = NoDB()
+    app.state.db_session_factory = None
+
+    rest, ws = [], []
+    with TestClient(app) as client:
+        # fresh user per turn, since the puzzle only has 1 house reply
+        for i in range(N):
+            session_id = f'bench{i}'
+            client.portal.call(app.state.redis.set, f'session:{session_id}',
+                               json.dumps({'user_id': session_id}))
+            client.cookies.set('session_id', session_id)
+
+            if i % 2 == 0:
+                client.get('/games/chess_puzzle/start')
+                rest.append(rest_turn(client))
+            else:
+                with client.websocket_connect('/games/chess_puzzle/ws') as conn:
+                    conn.send_json({'type': 'start'})
+                    conn.receive_json()
+                    ws.append(ws_turn(conn))
+
+    # client msgs per turn: 2 requests vs 1 ws message
+    print(f'{"flow":<6} {"median ms":>10} {"mean ms":>9} {"client msgs":>12}')
+    for name, times, msgs in (('rest', rest, 2), ('ws', ws, 1)):
+        print(f'{name:<6} {median(times) * 1e3:>10.3f} '
+              f'{sum(times) / len(times) * 1e3:>9.3f} {msgs:>12}')
+
+
+if __name__ == '__main__':
+    main()
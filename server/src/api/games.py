@@ -1,15 +1,20 @@
 '''
 Game logic interface for the frontend
 '''
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi import HTTPException, WebSocket, WebSocketDisconnect, status
+import json
 
-from ..depends.redis import get_redis
-from ..depends.sessions import get_session_id, get_session_manager
+from ..config import GAMES, SERVER_STATE, MAX_ACTIONS
+from ..config import LEADERBOARD_TOP, LEADERBOARD_AROUND, LEADERBOARD_MAX
 from ..depends.engine_reg import get_game_engine
+from ..depends.game_context import get_game_context, GameContext
 from ..depends.game_states import get_state_store
-from ..depends.streak import mark_played
-from ..services.leaderboard import rank_player
-from ..services.reset import get_current_epoch, seconds_til_next_reset
+from ..depends.redis import get_redis
+from ..depends.sessions import get_session_id, get_session_manager
+from ..services.play import start_game, play_update, play_house_turn, play_actions
+from ..services.play import wants_house_turn
+from ..services.reset import get_current_epoch
 from ..services.error import error
 
 
@@ -17,96 +22,181 @@ router = APIRouter(prefix="/games", tags=["games"])
 
 
 # session_id gated
-# mark_played checks if streak should be incremented
+# every endpoint is 1 redis read (session) + 1 pipelined write;
+# server-loaded states ride along w/ the session read, so a state
+# cache miss only costs a read of its own on a session cache hit.
+# states go out thru engine.render()
 @router.get("/{game_id}/start")
 async def start(game_id: str,
-                session_id=Depends(get_session_id),
-                sessions=Depends(get_session_manager),
+                response: Response,
                 engine=Depends(get_game_engine),
-                states=Depends(get_state_store),
-                _=Depends(mark_played)) -> dict:
+                ctx=Depends(get_game_context)):
     '''
     Returns the init state for the requested game.
     '''
-    session = await sessions.get(session_id)
-
-    user_id = session['user_id']  # want KeyError
-    if user_id is None:
-        raise error(401, 'Session expired')
+    user_id = await ctx.get_user_id()
+    state = await start_game(engine, ctx, user_id)
 
-    epoch = get_current_epoch()
-    state = await states.get(game_id, user_id, epoch)
-
-    is_reset = await engine.ensure_reset(epoch)
-    if state is None or is_reset:
-        # order matters in case user plays close to reset
-        # want state to timeout first
-        ttl = seconds_til_next_reset()
-        state = engine.init_state()
-        await states.store(game_id, user_id, epoch, state, ttl)
-    return state
+    # same for every new player, so serialized once per epoch.
+    # a returned Response skips the injected one, so copy its headers
+    initial = engine.initial
+    if initial is not None and state is initial.state:
+        return Response(initial.body, media_type='application/json',
+                        headers=dict(response.headers))
+    return engine.render(state)
 
 
 @router.post("/{game_id}/update")
 async def update(game_id: str,
                  payload: dict,
-                 session_id=Depends(get_session_id),
-                 sessions=Depends(get_session_manager),
                  engine=Depends(get_game_engine),
-                 states=Depends(get_state_store),
-                 redis=Depends(get_redis)) -> dict:
+                 ctx=Depends(get_game_context)) -> dict:
     '''
     Returns the updated state for the requested game.
     '''
-    session = await sessions.get(session_id)
-
-    user_id = session['user_id']  # want KeyError
-    if user_id is None:
-        raise error(401, 'Session expired')
-
-    # get ttl here so its consistent with current epoch.
-    # otherwise, might store w/ next epoch's ttl.
-    epoch = get_current_epoch()
-    ttl = seconds_til_next_reset()
-
-    # in case game resets during play
-    is_reset = await engine.ensure_reset(epoch)
-    if is_reset:
-        raise error(409, 'Game reset, restart required')
-
-    state = engine.update_state(payload["state"], payload["action"])
-    await states.store(game_id, user_id, epoch, state, ttl)
-
-    # live leaderboard update
-    await rank_player(game_id, user_id, epoch, state['score'], redis)
-    return state
+    state = client_state(payload)
+    user_id = await ctx.get_user_id(with_state=state is None)
+    state = await play_update(engine, ctx, user_id, payload["action"], state)
+    return engine.render(state)
 
 
 # optional
 @router.post("/{game_id}/house_turn")
 async def house_turn(game_id: str,
                      payload: dict,
-                     session_id=Depends(get_session_id),
-                     sessions=Depends(get_session_manager),
                      engine=Depends(get_game_engine),
-                     states=Depends(get_state_store)) -> dict:
+                     ctx=Depends(get_game_context)) -> dict:
     '''
     Plays the house turn for the requested game.
     '''
-    session = await sessions.get(session_id)
+    state = client_state(payload)
+    user_id = await ctx.get_user_id(with_state=state is None)
+    state = await play_house_turn(engine, ctx, user_id, state)
+    return engine.render(state)
 
-    user_id = session['user_id']  # want KeyError
-    if user_id is None:
-        raise error(401, 'Session expired')
 
+@router.post("/{game_id}/actions")
+async def actions(game_id: str,
+                  payload: dict,
+                  engine=Depends(get_game_engine),
+                  ctx=Depends(get_game_context)) -> dict:
+    '''
+    Plays a list of actions (+ house turns) in 1 request.
+    Returns the final state and the state after every step.
+    '''
+    state = client_state(payload)
+    user_id = await ctx.get_user_id(with_state=state is None)
+
+    actions = payload.get('actions')
+    if not isinstance(actions, list) or not 0 < len(actions) <= MAX_ACTIONS:
+        raise error(400, f'Expected 1 to {MAX_ACTIONS} actions')
+
+    state, steps = await play_actions(engine, ctx, user_id, actions,
+                                      GAMES[game_id].get('config', {}), state)
+    return {'state': engine.render(state),
+            'steps': [engine.render(step) for step in steps]}
+
+
+@router.get("/{game_id}/leaderboard")
+async def leaderboard(game_id: str,
+                      request: Request,
+                      top: int = Query(LEADERBOARD_TOP, ge=0, le=LEADERBOARD_MAX),
+                      around: int = Query(LEADERBOARD_AROUND, ge=0, le=LEADERBOARD_MAX),
+                      engine=Depends(get_game_engine),
+                      ctx=Depends(get_game_context)) -> dict:
+    '''
+    Returns today's live top K, the user's rank
+    and the players ranked around them.
+    '''
+    user_id = await ctx.get_user_id()
     epoch = get_current_epoch()
-    ttl = seconds_til_next_reset()
 
-    is_reset = await engine.ensure_reset(epoch)
-    if is_reset:
-        raise error(409, 'Game reset, restart required')
-
-    state = engine.play_house_turn(payload["state"])
-    await states.store(game_id, user_id, epoch, state, ttl)
-    return state
+    # top K is the same for everyone, so briefly cached per worker
+    cache = request.app.state.leaderboard_cache
+    key = (game_id, epoch, top)
+    cached = cache.get(key)
+
+    desc = GAMES[game_id]['rank_order'] == 'desc'
+    board = await ctx.read_leaderboard(user_id, epoch,
+                                       0 if cached is not None else top,
+                                       around, desc)
+    if cached is None:
+        cache.set(key, board['top'])
+    else:
+        board['top'] = cached
+    return board
+
+
+@router.websocket("/{game_id}/ws")
+async def game_ws(websocket: WebSocket,
+                  game_id: str,
+                  engine=Depends(get_game_engine),
+                  session_id=Depends(get_session_id),
+                  sessions=Depends(get_session_manager),
+                  states=Depends(get_state_store),
+                  redis=Depends(get_redis)):
+    '''
+    Same turns as the REST endpoints over 1 connection.
+    Authenticated once on connect; the state stays bound to the
+    connection, so turns never read it back from redis.
 
+    Client sends {"type": "start" | "update" | "house_turn", "action"?: {}},
+    server replies {"type", "state"} and pushes the house turn right after
+    an update if the game has one. Errors are {"type": "error", "status", "detail"}.
+    '''
+    ctx = GameContext(game_id, session_id, sessions, states, redis)
+    try:
+        user_id = await ctx.get_user_id()
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    game_config = GAMES[game_id].get('config', {})
+    state = None
+
+    try:
+        while True:
+            try:
+                msg = json.loads(await websocket.receive_text())
+                kind = msg.get('type')
+                if kind == 'start':
+                    state = await start_game(engine, ctx, user_id)
+                elif kind == 'update':
+                    state = await play_update(engine, ctx, user_id, msg['action'], state)
+                elif kind == 'house_turn':
+                    state = await play_house_turn(engine, ctx, user_id, state)
+                else:
+                    raise error(400, f'Unknown message type: {kind}')
+                await websocket.send_json({'type': kind, 'state': engine.render(state)})
+
+                # no round trip for the house reply
+                if kind == 'update' and wants_house_turn(game_config, state):
+                    state = await play_house_turn(engine, ctx, user_id, state)
+                    await websocket.send_json({'type': 'house_turn',
+                                               'state': engine.render(state)})
+
+            except HTTPException as e:
+                # i.e. 409 on reset: client restarts w/ "start"
+                if e.status_code == 409:
+                    state = None
+                await websocket.send_json({'type': 'error',
+                                           'status': e.status_code,
+                                           'detail': e.detail})
+            # ValueError: not JSON
+            except (KeyError, TypeError, AttributeError, ValueError):
+                await websocket.send_json({'type': 'error',
+                                           'status': 422,
+                                           'detail': 'Malformed message'})
+    except WebSocketDisconnect:
+        pass
+
+
+def client_state(payload: dict) -> dict | None:
+    '''
+    Returns the client's state to play on, or None to load the stored one.
+    Only trusts the client's state if SERVER_STATE is off.
+    '''
+    if not SERVER_STATE and 'state' in payload:
+        return payload['state']
+    return None
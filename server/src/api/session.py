@@ -4,7 +4,6 @@ Discord provides its own session id.
 from fastapi import APIRouter, Depends
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from secrets import token_urlsafe
 
 from ..depends.sessions import get_session_manager, get_session_id
 from ..services.reset import seconds_til_next_reset
@@ -24,22 +23,13 @@ async def create_session(body: CreateRequest,
     '''
     Frontend sends session id and discord id.
     Backend:
-     - creates session in Redis
+     - creates session in Redis (or signs a token, see SESSION_BACKEND)
      - sets and returns HTTP-only session cookie
     '''
-    session_id = token_urlsafe(32)
-    await sessions.create(session_id, body.user_id)
+    session_id = await sessions.new_session(body.user_id)
 
     r = JSONResponse({})
-    r.set_cookie(
-        key='session_id',
-        value=session_id,
-        httponly=True,
-        secure=True,      # HTTPS
-        samesite='none',  # req for Activities iframe
-        max_age=seconds_til_next_reset(),  # != sessions.ttl
-        path='/'  # controls which urls the browser sends cookies to
-    )
+    set_session_cookie(r, session_id)
     return r
 
 
@@ -54,6 +44,39 @@ async def heartbeat(session_id: str = Depends(get_session_id),
     ok = await sessions.heartbeat(session_id)
     if not ok:
         raise error(404, 'Session expired')
-    return JSONResponse({'ok': True})
+
+    r = JSONResponse({'ok': True})
+    # signed tokens carry their expiry, so extending = a new token
+    new_session_id = sessions.reissue(session_id)
+    if new_session_id is not None:
+        set_session_cookie(r, new_session_id)
+    return r
+
+
+# session id gated
+@router.post('/logout')
+async def logout(session_id: str = Depends(get_session_id),
+                 sessions = Depends(get_session_manager)):
+    '''
+    Revokes the session and clears the cookie.
+    '''
+    await sessions.revoke(session_id)
+
+    r = JSONResponse({'ok': True})
+    r.delete_cookie(key='session_id', path='/', secure=True,
+                    httponly=True, samesite='none')
+    return r
+
+
+def set_session_cookie(r: JSONResponse, session_id: str):
+    r.set_cookie(
+        key='session_id',
+        value=session_id,
+        httponly=True,
+        secure=True,      # HTTPS
+        samesite='none',  # req for Activities iframe
+        max_age=seconds_til_next_reset(),  # != sessions.ttl
+        path='/'  # controls which urls the browser sends cookies to
+    )
 
 
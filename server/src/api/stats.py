@@ -1,21 +1,73 @@
-from fastapi import APIRouter, Depends
+from datetime import date, datetime, time
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+import hashlib
+import json
+import redis.asyncio as Redis
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..db.models.stats import Stats
+from ..config import STATS_PAGE_SIZE, HISTORY_PAGE_SIZE, STATS_STALE_MAX_AGE
+from ..db.models.stats import Stats, Ranking
 from ..depends.db_session import get_db_session
+from ..depends.redis import get_redis
 from ..services.error import error
+from ..services.reset import get_prev_epoch, seconds_til_next_reset
+from ..services.save import stats_version_key
 
 router = APIRouter(prefix='/api/stats')
 
 
 # Mainly for discord bot, so no session id block
 @router.get('/{game_id}/daily')
-async def daily_stats(game_id: str,
-                      db_session: AsyncSession=Depends(get_db_session)) -> dict:
+async def daily_stats(request: Request,
+                      game_id: str,
+                      after: int = Query(0, ge=0),
+                      limit: int = Query(STATS_PAGE_SIZE, ge=1, le=STATS_PAGE_SIZE),
+                      redis: Redis=Depends(get_redis),
+                      db_session: AsyncSession=Depends(get_db_session)) -> Response:
     '''
     Returns daily stats for requested game.
+    Rankings are paged: pass the last rank received as after.
+    Cached per worker until the next save, so most polls skip the DB.
     '''
+    cache = request.app.state.stats_cache
+    key = (game_id, after, limit)
+
+    # bumped by save_stats_to_db() on any worker
+    version = await redis.get(stats_version_key(game_id))
+    cached = cache.get(key)
+    if cached is None or cached['version'] != version:
+        stats = await _daily_stats(game_id, after, limit, db_session)
+        body = json.dumps(jsonable_encoder(stats), separators=(',', ':')).encode('utf-8')
+        cached = {
+            'version': version,
+            'etag': f'"{hashlib.sha1(body).hexdigest()}"',
+            'body': body,
+            'date': stats['date'].isoformat(),
+        }
+        cache.set(key, cached, ttl=seconds_til_next_reset())
+
+    # fixed til the next reset once the last epoch is persisted
+    if cached['date'] == get_prev_epoch():
+        max_age = seconds_til_next_reset()
+    else:
+        max_age = STATS_STALE_MAX_AGE
+
+    headers = {
+        'ETag': cached['etag'],
+        'Cache-Control': f'public, max-age={max_age}',
+    }
+    if_none_match = request.headers.get('if-none-match', '')
+    if cached['etag'] in (tag.strip() for tag in if_none_match.split(',')):
+        return Response(status_code=304, headers=headers)
+    return Response(cached['body'], media_type='application/json', headers=headers)
+
+
+async def _daily_stats(game_id: str,
+                       after: int,
+                       limit: int,
+                       db_session: AsyncSession) -> dict:
     async with db_session.begin():
         res = await db_session.execute(
             select(Stats)
@@ -27,9 +79,66 @@ async def daily_stats(game_id: str,
         if stats is None:
             raise error(404, f'Stats not found for {game_id}')
 
+        # keyset on the pk, so any page is an index range scan
+        res = await db_session.execute(
+            select(Ranking.rank, Ranking.user_id, Ranking.score)
+            .where(Ranking.game_id == game_id,
+                   Ranking.date == stats.date,
+                   Ranking.rank > after)
+            .order_by(Ranking.rank)
+            .limit(limit)
+        )
+        rankings = [{'user_id': user_id, 'score': score}
+                    for _, user_id, score in res]
+
         return {
             'date': stats.date.date(),
-            'rankings': stats.rankings,
+            'rankings': rankings,
+            'players': stats.players,
+            'next': after + len(rankings) if after + len(rankings) < stats.players else None,
             'outof': stats.outof,
             'streak': stats.streak,
         }
+
+
+@router.get('/{game_id}/history')
+async def stats_history(game_id: str,
+                        before: date | None = None,
+                        since: date | None = None,
+                        until: date | None = None,
+                        limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=STATS_PAGE_SIZE),
+                        db_session: AsyncSession=Depends(get_db_session)) -> dict:
+    '''
+    Returns past daily stats, newest first, optionally within [since, until].
+    Paged: pass the returned next date as before.
+    '''
+    # keyset on the (game_id, date) pk, so deep pages stay as cheap as the 1st
+    query = select(Stats).where(Stats.game_id == game_id)
+    if before is not None:
+        query = query.where(Stats.date < _to_datetime(before))
+    if since is not None:
+        query = query.where(Stats.date >= _to_datetime(since))
+    if until is not None:
+        query = query.where(Stats.date <= _to_datetime(until))
+
+    async with db_session.begin():
+        res = await db_session.execute(
+            query.order_by(Stats.date.desc()).limit(limit + 1)
+        )
+        rows = res.scalars().all()
+
+    days = [{
+        'date': stats.date.date(),
+        'players': stats.players,
+        'outof': stats.outof,
+        'streak': stats.streak,
+    } for stats in rows[:limit]]
+
+    return {
+        'days': days,
+        'next': days[-1]['date'] if len(rows) > limit else None,
+    }
+
+
+def _to_datetime(d: date) -> datetime:
+    return datetime.combine(d, time())
@@ -9,7 +9,47 @@ b_TEST = True
 # adjustable constants
 GAME_RESET_HOUR = 0   # midnight UTC
 SESSION_TTL = 60      # lifetime in secs >= 2x heartbeat
+SESSION_CACHE_TTL = 5 # secs a worker trusts a session w/o checking redis
+SESSION_CACHE_SIZE = 10_000
+# 'redis': session ids are looked up in redis.
+# 'token': session ids are signed tokens (needs SESSION_SECRET in .env)
+SESSION_BACKEND = 'redis'
 REQUEST_TIMEOUT = 10  # httpx client timeout in secs
+RESET_LEAD = 60       # secs before reset that the next epoch is prepared
+ENGINE_TIMEOUT = 30   # secs each engine gets to warm up on startup
+PERSIST_RETRIES = 5   # stats saves after reset (backoff 1, 2, 4.. secs)
+PERSIST_CHUNK = 1000  # leaderboard rows read from redis + inserted at a time
+STATS_PAGE_SIZE = 100 # max rankings per /api/stats page
+HISTORY_PAGE_SIZE = 30   # default days per /api/stats history page
+STATS_CACHE_SIZE = 256   # per-worker cached /api/stats/daily responses
+STATS_STALE_MAX_AGE = 60 # client cache secs while the last epoch isnt persisted yet
+LEASE_TTL = 30        # secs a worker may hold a reset job (fetch/persist) for
+LEASE_POLL = 0.1      # secs between checks while another worker holds it
+PREFETCH_SIZE = 7             # puzzles queued in redis ahead of resets
+PREFETCH_INTERVAL = 60 * 60   # secs between queue top ups
+CORPUS_RATING = None  # e.g. 1500: only serve corpus puzzles rated 1500..1599
+CORPUS_THEME = None   # e.g. 'mateIn2'; overrides CORPUS_RATING
+
+# True: server loads game states itself and ignores any state the client sends.
+# False: client may still omit the state to have it loaded.
+SERVER_STATE = False
+# max actions per /games/{game_id}/actions request
+MAX_ACTIONS = 32
+# per-worker write-through cache of game states (0 disables).
+# workers dont share it: a stale entry fails its seq check on write (409)
+# and is dropped, and a miss is read along w/ the session, so it is safe
+# w/ any number of workers; sticky clients just hit it more
+STATE_CACHE_SIZE = 10_000
+# live leaderboard reads: default top K / players on each side of the caller,
+# and secs the top K is cached per worker
+LEADERBOARD_TOP = 10
+LEADERBOARD_AROUND = 2
+LEADERBOARD_MAX = 100
+LEADERBOARD_TTL = 2
+MINESWEEPER_NDIM = 8    # board is ndim x ndim
+MINESWEEPER_MINES = 10
+# per-engine cache of parsed positions (FEN -> legal moves), cleared every reset
+POSITION_CACHE_SIZE = 1024
 
 # grab game specs
 fpath = Path(__file__).resolve().parents[2] / "shared" / "game_reg.json"
@@ -22,6 +62,9 @@ GAMES = specs['games']
 load_dotenv()
 
 LICHESS_SECRET = environ.get('LICHESS_SECRET')
+SESSION_SECRET = environ.get('SESSION_SECRET')
+# path to the lichess puzzle db CSV; if set, puzzles are served offline from it
+PUZZLE_CORPUS = environ.get('PUZZLE_CORPUS')
 
 # discord dev stuff
 DISCORD_API_URL = "https://discord.com/api/v10"
@@ -1,15 +1,32 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Index
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
 
 
+# 1 row per game per day; pk also serves latest + history lookups.
+# not the old "stats" table (rankings JSON, other pk): create_all never
+# alters tables, so new name = created on startup (see README, Upgrading)
 class Stats(AsyncAttrs, Base):
-    __tablename__ = "stats"
+    __tablename__ = "daily_stats"
     game_id = Column(String, primary_key=True)
-    date = Column(DateTime, nullable=False)
-    rankings = Column(JSON, default=list, nullable=False)  # list of {user_id, score}
+    date = Column(DateTime, primary_key=True)
+    players = Column(Integer, default=0, nullable=False)  # no. rows in rankings
     outof = Column(Integer, nullable=False)
     streak = Column(Integer, default=0, nullable=False)
 
+
+# 1 row per player per day, so rows stay small no matter the player count
+class Ranking(AsyncAttrs, Base):
+    __tablename__ = "rankings"
+    game_id = Column(String, primary_key=True)
+    date = Column(DateTime, primary_key=True)
+    rank = Column(Integer, primary_key=True)  # 1 = best
+    user_id = Column(String, nullable=False)
+    score = Column(Integer, nullable=False)
+
+    # pk serves pages of a day; this serves a player's history
+    __table_args__ = (
+        Index('ix_rankings_user', 'game_id', 'user_id', 'date'),
+    )
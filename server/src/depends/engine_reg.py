@@ -6,29 +6,72 @@ Player states/game are stored in redis and loaded into engine on update call.
 
 This way, frontend can swap games w/o reloading backend.
 '''
-from fastapi import FastAPI, Request, Path
+import asyncio
+import logging
+from fastapi import FastAPI, Path
+from fastapi.requests import HTTPConnection
+from importlib import import_module
+from importlib.metadata import entry_points
 
 from ..services.error import error
 from ..engines.base import GameEngine
-from ..engines.chess_puzzle import ChessPuzzleEngine
-from ..engines.minesweeper import MinesweeperEngine
-from ..providers.lichess import fetch_daily_puzzle
+from ..config import PUZZLE_CORPUS, ENGINE_TIMEOUT, PERSIST_RETRIES
+from ..providers.prefetch import PuzzleQueue
 
 
+logger = logging.getLogger(__name__)
+
+# engine and provider are import strings ('module:attr', relative to src/),
+# only imported once the game is enabled in game_reg.json,
+# so a worker never loads another game's dependencies (i.e. python-chess).
+# provider: async (http_client, epoch) -> dict, or None if no external data
+# prefetch: queue puzzles in redis ahead of resets (providers/prefetch.py)
 ENGINES = {
     'chess_puzzle': {
-        'engine': ChessPuzzleEngine,
-        'provider': fetch_daily_puzzle,
+        'engine': '.engines.chess_puzzle:ChessPuzzleEngine',
+        # local corpus is seeded by epoch and needs no queue
+        'provider': ('.providers.corpus:fetch_corpus_puzzle' if PUZZLE_CORPUS
+                     else '.providers.lichess:fetch_next_puzzle'),
+        'prefetch': not PUZZLE_CORPUS,
     },
     'minesweeper': {
-        'engine': MinesweeperEngine,
+        'engine': '.engines.minesweeper:MinesweeperEngine',
         'provider': None,
+        'prefetch': False,
     },
 }
 
+# installed packages can add games w/o editing ENGINES:
+#   [project.entry-points."discordle.engines"]
+#   my_game = "my_pkg.registry:SPEC"   # a dict like the ones above
+ENTRY_POINT_GROUP = 'discordle.engines'
+
+
+def get_engine_spec(game_id: str) -> dict | None:
+    '''
+    Returns the registry entry for game_id; ENGINES first, then entry points.
+    '''
+    spec = ENGINES.get(game_id)
+    if spec is not None:
+        return spec
+    for ep in entry_points(group=ENTRY_POINT_GROUP, name=game_id):
+        return ep.load()
+    return None
+
+
+def resolve(target):
+    '''
+    Imports 'module:attr'; anything else (i.e. already a class) is returned as is.
+    '''
+    if not isinstance(target, str):
+        return target
+    module, _, attr = target.partition(':')
+    # relative strings are relative to src/
+    return getattr(import_module(module, package=__package__.rpartition('.')[0]), attr)
+
 
 # called by api/games
-async def get_game_engine(request: Request,
+async def get_game_engine(request: HTTPConnection,
                           game_id: str = Path(...)) -> GameEngine:
     '''
     Receives game_id from frontend route,
@@ -43,21 +86,75 @@ async def get_game_engine(request: Request,
 
 # called by main.py @asynccontextmanager so no Depends()
 async def init_game_engine(game_id: str, app: FastAPI) -> GameEngine:
-    engine = ENGINES.get(game_id)
+    engine = get_engine_spec(game_id)
     if not engine:
         raise error(404, f'Unknown game: {game_id}')
 
-    engine_cls = engine['engine']
-    provider = engine['provider']
+    engine_cls = resolve(engine['engine'])
+    provider = resolve(engine.get('provider'))
 
     # if game doesnt need external data
     if provider is None:
         return engine_cls(game_id, app.state.redis, app.state.db_session_factory)
 
-    fetcher = lambda: provider(app.state.http)
+    fetch = lambda epoch=None: provider(app.state.http, epoch)
+    if engine.get('prefetch'):
+        # filled by main.py lifespan; queued puzzles have no epoch yet
+        queue = PuzzleQueue(game_id, app.state.redis, fetch)
+        app.state.puzzle_queues[game_id] = queue
+        fetcher = queue.pop
+    else:
+        fetcher = fetch
+
     return engine_cls(game_id,
                       app.state.redis,
                       app.state.db_session_factory,
                       fetcher)
 
 
+
+
+# called by main.py lifespan
+async def start_game_engine(game_id: str,
+                            app: FastAPI,
+                            timeout: float = ENGINE_TIMEOUT) -> bool:
+    '''
+    Inits and warms up game_id's engine within timeout secs,
+    then marks it ready in app.state.ready (see GET /ready).
+    Returns whether it is hot.
+
+    Init failures (i.e. a missing engine dependency) abort startup;
+    they wont fix themselves. An engine that failed to warm up still
+    serves requests (the 1st one resets it) and keeps warming up
+    in the background.
+    '''
+    app.state.ready[game_id] = False
+    app.state.engines[game_id] = engine = await init_game_engine(game_id, app)
+
+    try:
+        await asyncio.wait_for(engine.warmup(), timeout)
+    except Exception as e:
+        logger.warning('Failed to warm up %s engine, retrying in background: %r', game_id, e)
+        # hold a ref so the task isnt garbage collected
+        task = asyncio.create_task(_keep_warming(game_id, engine, app))
+        app.state.warmups.add(task)
+        task.add_done_callback(app.state.warmups.discard)
+        return False
+
+    app.state.ready[game_id] = True
+    return True
+
+
+async def _keep_warming(game_id: str, engine: GameEngine, app: FastAPI):
+    attempt = 0
+    while True:
+        # backoff 1, 2, 4.. secs, capped
+        await asyncio.sleep(2 ** min(attempt, PERSIST_RETRIES))
+        try:
+            await engine.warmup()
+            app.state.ready[game_id] = True
+            logger.info('%s engine warmed up', game_id)
+            return
+        except Exception as e:
+            logger.warning('Failed to warm up %s engine: %r', game_id, e)
+            attempt += 1
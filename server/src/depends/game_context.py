@@ -0,0 +1,182 @@
+'''
+Fuses the redis calls of a game request into as few round trips as possible:
+ - 1 read for the session, along w/ the state if the request loads one
+ - 1 MULTI pipeline for every write (and any read that can ride along),
+   or 1 script for a state write + its leaderboard update
+
+Every round trip is counted and reported in the X-Redis-Round-Trips header,
+so each endpoint can be checked to stay at 2 or less.
+'''
+from fastapi import Depends, Response
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+
+from .redis import get_redis
+from .sessions import get_session_id, get_session_manager, SessionManager
+from .game_states import get_state_store, GameStateStore
+from .streak import queue_mark_played
+from ..services.leaderboard import rank_args, read_leaderboard
+from ..services.reset import get_current_epoch
+from ..services.error import error
+
+
+def get_game_context(game_id: str,
+                     response: Response,
+                     session_id=Depends(get_session_id),
+                     sessions=Depends(get_session_manager),
+                     states=Depends(get_state_store),
+                     redis=Depends(get_redis)):
+    return GameContext(game_id, session_id, sessions, states, redis, response)
+
+
+class GameContext:
+    '''
+    Per-request redis interface for api/games.
+    Writes are queued with the methods below and sent on commit().
+    '''
+    def __init__(self,
+                 game_id: str,
+                 session_id: str,
+                 sessions: SessionManager,
+                 states: GameStateStore,
+                 redis: Redis,
+                 response: Response | None = None):
+        self.game_id = game_id
+        self.session_id = session_id
+        self.sessions = sessions
+        self.states = states
+        self.redis = redis
+        self.response = response
+        self.round_trips = 0
+        self._pipe: Pipeline | None = None
+        self._seqs: dict[tuple[str, str], int] = {}  # (user_id, epoch) -> seq read
+        # (user_id, epoch) -> (state, seq) read along w/ the session
+        self._prefetched: dict[tuple[str, str], tuple[dict | None, int]] = {}
+
+
+    def _count(self):
+        self.round_trips += 1
+        if self.response is not None:
+            self.response.headers['X-Redis-Round-Trips'] = str(self.round_trips)
+
+
+    @property
+    def pipe(self) -> Pipeline:
+        if self._pipe is None:
+            self._pipe = self.redis.pipeline(transaction=True)
+        return self._pipe
+
+
+    async def get_user_id(self, with_state: bool = False) -> str:
+        '''
+        Returns the session's user_id; raises 401 if expired.
+        Free on a session cache hit. On a miss, with_state also reads
+        the user's current state for load_state() in the same round trip.
+        '''
+        session = self.sessions.get_cached(self.session_id)
+        if session is None:
+            if with_state and isinstance(self.sessions, SessionManager):
+                session = await self._fetch_with_state()
+            else:
+                session = await self.sessions.fetch(self.session_id)
+            self._count()
+        if session is None or session['user_id'] is None:
+            raise error(401, 'Session expired')
+        return session['user_id']
+
+
+    async def load_state(self, user_id: str, epoch: str) -> dict | None:
+        '''
+        Returns the stored state; free on a state cache hit
+        or if read along w/ the session.
+        '''
+        cached = (self._prefetched.pop((user_id, epoch), None)
+                  or self.states.get_cached(self.game_id, user_id, epoch))
+        if cached is None:
+            cached = await self.states.fetch(self.game_id, user_id, epoch)
+            self._count()
+        state, self._seqs[(user_id, epoch)] = cached
+        return state
+
+
+    async def _fetch_with_state(self) -> dict | None:
+        # epoch may roll over before load_state(); it then reads again
+        epoch = get_current_epoch()
+        prefix, suffix = self.states.key_parts(self.game_id, epoch)
+        session, user_id, raw, seq = await self.sessions.fetch_with_state(
+                self.session_id, prefix, suffix)
+        if session is not None and user_id is not None and session['user_id'] == user_id:
+            self._prefetched[(user_id, epoch)] = self.states.load(
+                    self.game_id, user_id, epoch, raw, seq)
+        return session
+
+
+    def mark_played(self, epoch: str):
+        queue_mark_played(self.pipe, self.game_id, epoch)
+
+
+    async def init_state(self,
+                         user_id: str,
+                         epoch: str,
+                         state: dict | bytes,
+                         ttl: int,
+                         overwrite: bool = False) -> dict | None:
+        '''
+        Stores state only if the user has none yet (or overwrite)
+        and returns whichever state is stored.
+        Commits along w/ everything queued.
+        '''
+        self.states.queue_init(self.pipe, self.game_id, user_id, epoch,
+                               state, ttl, overwrite)
+        state, seq = self.states.decode_init(await self.commit())
+        self._seqs[(user_id, epoch)] = seq
+        if state is not None:
+            self.states.cache_state(self.game_id, user_id, epoch, state, ttl, seq)
+        return state
+
+
+    async def store_state(self,
+                          user_id: str,
+                          epoch: str,
+                          state: dict,
+                          ttl: int,
+                          score: int | None = None):
+        '''
+        Stores state and, if given a score, ranks the player in 1 script.
+        Raises 409 if the state changed since it was read (i.e. another tab
+        moved 1st); states sent by the client werent read, so are written as is.
+        '''
+        rank = rank_args(self.game_id, user_id, epoch, score) if score is not None else None
+        seq = await self.states.commit(self.game_id, user_id, epoch, state, ttl,
+                                       self._seqs.get((user_id, epoch)), rank)
+        self._count()
+        if seq is None:
+            # restart reads the latest state from redis
+            raise error(409, 'State changed, restart required')
+        self._seqs[(user_id, epoch)] = seq
+
+
+    async def read_leaderboard(self,
+                               user_id: str,
+                               epoch: str,
+                               top: int,
+                               around: int,
+                               desc: bool) -> dict:
+        board = await read_leaderboard(self.game_id, user_id, epoch,
+                                       top, around, desc, self.redis)
+        self._count()
+        return board
+
+
+    async def commit(self) -> list:
+        '''
+        Sends every queued command in one MULTI/EXEC.
+        Returns the replies in queued order.
+        '''
+        if self._pipe is None or len(self._pipe) == 0:
+            return []
+
+        pipe, self._pipe = self._pipe, None
+        replies = await pipe.execute()
+        self._count()
+        return replies
@@ -1,21 +1,84 @@
 from fastapi import Depends
-import json
+from fastapi.requests import HTTPConnection
 from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
 
 from .redis import get_redis
+from .engine_reg import get_game_engine
+from ..services.cache import LRUCache
+from ..engines.base import GameEngine
+from ..services.codec import JSONCodec, is_init_ref
+from ..services.scripts import run_script
+from ..services.reset import seconds_til_next_reset
 
 
-def get_state_store(redis=Depends(get_redis)):
-    return GameStateStore(redis)
+# a state is 1 small hash: STATE_FIELD = encoded state, SEQ_FIELD = seq,
+# so the seq costs no key (or ttl) of its own
+STATE_FIELD = 'v'
+SEQ_FIELD = 's'
+
+# compare-and-set of a state + its leaderboard entry in 1 round trip.
+# every write bumps the state's seq; a write expecting an older seq is
+# rejected, so 2 tabs playing at once cant overwrite each other.
+# KEYS: state[, leaderboard]
+# ARGV: expected seq ('' to skip the check), state, ttl[, score, user_id, 'GT' | 'LT']
+# returns {1 if written, seq now stored}
+COMMIT_SCRIPT = f'''
+local seq = tonumber(redis.call('HGET', KEYS[1], '{SEQ_FIELD}') or '0')
+if ARGV[1] ~= '' and tonumber(ARGV[1]) ~= seq then
+    return {{0, seq}}
+end
+
+seq = seq + 1
+redis.call('HSET', KEYS[1], '{STATE_FIELD}', ARGV[2], '{SEQ_FIELD}', seq)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+if KEYS[2] then
+    redis.call('ZADD', KEYS[2], ARGV[6], ARGV[4], ARGV[5])
+end
+return {{1, seq}}
+'''
+
+
+def get_state_store(request: HTTPConnection,
+                    redis=Depends(get_redis),
+                    engine=Depends(get_game_engine)):
+    return GameStateStore(redis, request.app.state.state_cache, engine.codec, engine)
 
 
 class GameStateStore:
-    def __init__(self, redis: Redis):
+    '''
+    Redis interface for game states.
+    If given a cache, it is written through on store() and read first on get().
+    Cached states are shared, so treat returned states as read-only.
+    States are encoded w/ the engine's codec (GameEngine.codec).
+    Players still on the init state store the engine's InitState.ref,
+    which decodes to the shared engine.initial.state.
+
+    Every state has a seq (0 until its 1st write), stored in the same hash,
+    read along w/ it and checked by commit(); cached states are cached w/ theirs.
+    '''
+    def __init__(self,
+                 redis: Redis,
+                 cache: LRUCache | None = None,
+                 codec: JSONCodec | None = None,
+                 engine: GameEngine | None = None):
         self.redis = redis
+        self.cache = cache
+        self.codec = codec or JSONCodec()
+        self.engine = engine
 
 
     def _key(self, game_id: str, user_id: str, epoch: str) -> str:
-        return f'game:{game_id}:{user_id}:{epoch}'
+        prefix, suffix = self.key_parts(game_id, epoch)
+        return f'{prefix}{user_id}{suffix}'
+
+
+    def key_parts(self, game_id: str, epoch: str) -> tuple[str, str]:
+        '''
+        Returns the state key around the user_id, for scripts that build it.
+        '''
+        # hashes; not the string keys states used to be stored in
+        return f'game:{game_id}:state:', f':{epoch}'
 
 
     async def store(self,
@@ -25,27 +88,152 @@ class GameStateStore:
                     state: dict,
                     ttl: int):
         '''
-        Stores the game state in redis; must be JSON-serializable.
+        Stores the game state in redis; must be encodable by self.codec.
         ttl == seconds_til_next_reset()
         '''
-        await self.redis.set(
-                self._key(game_id, user_id, epoch),
-                json.dumps(state),
-                ex=ttl
-        )
+        await self.commit(game_id, user_id, epoch, state, ttl)
+
+
+    async def commit(self,
+                     game_id: str,
+                     user_id: str,
+                     epoch: str,
+                     state: dict,
+                     ttl: int,
+                     seq: int | None = None,
+                     rank: tuple[str, list] | None = None) -> int | None:
+        '''
+        Stores the state if its seq is still seq (None skips the check)
+        and, if given rank = (leaderboard key, [score, user_id, 'GT' | 'LT']),
+        ranks the player, atomically.
+        Returns the new seq, or None if the state was stale.
+        '''
+        keys = [self._key(game_id, user_id, epoch)]
+        args = ['' if seq is None else seq, self.encode(state), ttl]
+        if rank is not None:
+            keys.append(rank[0])
+            args.extend(rank[1])
+
+        written, new_seq = await run_script(self.redis, COMMIT_SCRIPT, keys, args)
+        if not written:
+            # so is the cached copy, if any
+            if self.cache is not None:
+                self.cache.pop(keys[0])
+            return None
+        self.cache_state(game_id, user_id, epoch, state, ttl, new_seq)
+        return new_seq
 
 
     async def get(self, game_id: str, user_id: str, epoch: str) -> dict:
         '''
         Returns game state.
         '''
-        state = await self.redis.get(self._key(game_id, user_id, epoch))
-        if state is None:
+        cached = self.get_cached(game_id, user_id, epoch)
+        if cached is not None:
+            return cached[0]
+        return (await self.fetch(game_id, user_id, epoch))[0]
+
+
+    async def fetch(self,
+                    game_id: str,
+                    user_id: str,
+                    epoch: str) -> tuple[dict | None, int]:
+        '''
+        Returns (game state, seq) from redis, skipping the cache.
+        '''
+        raw, seq = await self.redis.hmget(self._key(game_id, user_id, epoch),
+                                          STATE_FIELD, SEQ_FIELD)
+        return self.load(game_id, user_id, epoch, raw, seq)
+
+
+    def load(self,
+             game_id: str,
+             user_id: str,
+             epoch: str,
+             raw: bytes | None,
+             seq: bytes | None) -> tuple[dict | None, int]:
+        '''
+        Decodes and caches a (game state, seq) read from redis.
+        '''
+        state, seq = self.decode(raw), int(seq or 0)
+        if state is not None:
+            # dont know the remaining ttl here, so expire w/ the epoch
+            self.cache_state(game_id, user_id, epoch, state,
+                             seconds_til_next_reset(), seq)
+        return state, seq
+
+
+    def get_cached(self,
+                   game_id: str,
+                   user_id: str,
+                   epoch: str) -> tuple[dict, int] | None:
+        '''
+        Returns the cached (game state, seq).
+        '''
+        if self.cache is None:
             return None
+        return self.cache.get(self._key(game_id, user_id, epoch))
+
 
-        # redis.asyncio returns bytes so decode
+    def cache_state(self,
+                    game_id: str,
+                    user_id: str,
+                    epoch: str,
+                    state: dict,
+                    ttl: int,
+                    seq: int):
+        '''
+        Only call once the state is stored in redis.
+        '''
+        if self.cache is not None:
+            self.cache.set(self._key(game_id, user_id, epoch), (state, seq), ttl)
+
+
+    def queue_init(self,
+                   pipe: Pipeline,
+                   game_id: str,
+                   user_id: str,
+                   epoch: str,
+                   state: dict | bytes,
+                   ttl: int,
+                   overwrite: bool = False):
+        '''
+        Queues storing state if the user has none yet (or overwrite)
+        and reading back whichever state is stored + its seq;
+        decode the last 2 replies w/ decode_init().
+        '''
+        key = self._key(game_id, user_id, epoch)
+        if overwrite:
+            pipe.hset(key, STATE_FIELD, self.encode(state))
+            # writes expecting the overwritten state are stale now
+            pipe.hincrby(key, SEQ_FIELD, 1)
+        else:
+            pipe.hsetnx(key, STATE_FIELD, self.encode(state))
+        # ttl ends at the reset, so refreshing it on a kept state is a no-op
+        pipe.expire(key, ttl)
+        pipe.hmget(key, STATE_FIELD, SEQ_FIELD)
+
+
+    def decode_init(self, replies: list) -> tuple[dict | None, int]:
+        '''
+        Returns (state, seq) from queue_init()'s replies.
+        '''
+        raw, seq = replies[-1]
+        return self.decode(raw), int(seq or 0)
+
+
+    def encode(self, state: dict | bytes) -> bytes:
+        # bytes are already encoded, i.e. an InitState.ref
         if isinstance(state, bytes):
-            state = state.decode('utf-8')
+            return state
+        return self.codec.encode(state)
 
-        return json.loads(state)
 
+    def decode(self, state: bytes | str | None) -> dict | None:
+        initial = self.engine.initial if self.engine is not None else None
+        if initial is not None and state == initial.ref:
+            return initial.state
+        # ref to another epoch's init state; request straddled a reset
+        if state is not None and is_init_ref(state):
+            return None
+        return self.codec.decode(state)
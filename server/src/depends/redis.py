@@ -1,6 +1,7 @@
-from fastapi import Request
+from fastapi.requests import HTTPConnection
 
 
-def get_redis(request: Request):
+# HTTPConnection so websocket endpoints can depend on these too
+def get_redis(request: HTTPConnection):
     return request.app.state.redis
 
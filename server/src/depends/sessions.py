@@ -1,74 +1,367 @@
-from fastapi import Request, Depends
-import json
+from fastapi import Depends
+from fastapi.requests import HTTPConnection
 from redis.asyncio import Redis
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+from secrets import token_urlsafe
+import time
 
-from ..config import SESSION_TTL
+from ..config import SESSION_TTL, SESSION_BACKEND
 from .redis import get_redis
+from ..services.cache import LRUCache
 from ..services.error import error
+from ..services.codec import MsgpackCodec
+from ..services.scripts import run_script
+from .game_states import STATE_FIELD, SEQ_FIELD
+
+
+# GET of a session + its user's state in 1 round trip, for requests that
+# load a state right after the session (see depends/game_context.py).
+# the user_id is only read if the session starts w/ ARGV[3], the exact
+# bytes SessionManager.codec writes before it (so a new codec version
+# never matches), or is legacy JSON; otherwise only the session is
+# returned and the caller reads the state itself.
+# the state key is only known once the session is read, so it isnt in
+# KEYS: needs a single redis node (no Cluster slot routing) and an ACL
+# allowing game:* keys.
+# KEYS: session
+# ARGV: state key prefix, suffix (state key = prefix .. user_id .. suffix),
+#       SessionManager.user_id_prefix
+# returns {session, user_id, state, seq}, or {session} w/o a user_id
+FETCH_WITH_STATE_SCRIPT = f'''
+local session = redis.call('GET', KEYS[1])
+if not session then
+    return {{false}}
+end
+
+local user_id
+local prefix = ARGV[3]
+if string.sub(session, 1, #prefix) == prefix then
+    -- msgpack str: fixstr or str8
+    local at = #prefix + 1
+    local tag = string.byte(session, at)
+    if tag and tag >= 0xa0 and tag <= 0xbf then
+        user_id = string.sub(session, at + 1, at + tag - 0xa0)
+    elseif tag == 0xd9 then
+        user_id = string.sub(session, at + 2, at + 1 + string.byte(session, at + 1))
+    end
+else
+    local ok, decoded = pcall(cjson.decode, session)
+    if ok and type(decoded) == 'table' and type(decoded.user_id) == 'string' then
+        user_id = decoded.user_id
+    end
+end
+if not user_id then
+    return {{session}}
+end
+
+local key = ARGV[1] .. user_id .. ARGV[2]
+local state = redis.call('HMGET', key, '{STATE_FIELD}', '{SEQ_FIELD}')
+return {{session, user_id, state[1], state[2]}}
+'''
 
 
-def get_session_id(request: Request):
+def get_session_id(request: HTTPConnection):
     session_id = request.cookies.get('session_id')
     if not session_id:
         raise error(401, 'User not authenticated')
     return session_id
 
 
-def get_session_manager(redis=Depends(get_redis)):
-    return SessionManager(redis)
+def get_session_manager(request: HTTPConnection, redis=Depends(get_redis)):
+    # stateless, so 1 per app (see main.py)
+    if SESSION_BACKEND == 'token':
+        return request.app.state.token_sessions
+    return SessionManager(redis,
+                          cache=request.app.state.session_cache,
+                          heartbeats=request.app.state.heartbeats)
 
 
 class SessionManager:
     '''
     Redis interface for sessions.
+    Sessions are cached per worker for a few secs (see main.py),
+    so a revoked session may still pass until its entry expires.
     '''
-    def __init__(self, redis: Redis, ttl=SESSION_TTL):
+    codec = MsgpackCodec(('user_id',))
+    # bytes codec.encode() writes before the user_id: header + fixarray
+    user_id_prefix = codec.header + bytes([0x90 | len(codec.fields)])
+
+    def __init__(self,
+                 redis: Redis,
+                 ttl=SESSION_TTL,
+                 cache: LRUCache | None = None,
+                 heartbeats: 'HeartbeatBatcher | None' = None):
         self.redis = redis
         self.ttl = ttl
+        self.cache = cache
+        self.heartbeats = heartbeats
 
 
     def _key(self, session_id: str) -> str:
         return f'session:{session_id}'
 
 
+    async def new_session(self, user_id: str) -> str:
+        '''
+        Returns the id of a new session for user_id.
+        '''
+        session_id = token_urlsafe(32)
+        await self.create(session_id, user_id)
+        return session_id
+
+
     async def create(self, session_id: str, user_id: str, ttl: int | None = None):
         '''
         Create a new session in redis.
-        user_id must be JSON-serializable.
+        user_id must be encodable by self.codec.
         '''
         # if ttl is not None, it is truthy so short circuit
         ttl = ttl or self.ttl
 
+        session = {'user_id': user_id}
         await self.redis.set(
                 self._key(session_id),
-                json.dumps({'user_id': user_id}),
+                self.codec.encode(session),
                 ex=ttl
         )
+        if self.cache is not None:
+            self.cache.set(session_id, session)
 
 
     async def get(self, session_id: str) -> dict | None:
         '''
-        Decodes and returns user_id from redis.
+        Returns the session; from the cache if possible.
         '''
-        key = self._key(session_id)
-        user_id = await self.redis.get(key)
-        if user_id is None:
+        session = self.get_cached(session_id)
+        if session is None:
+            session = await self.fetch(session_id)
+        return session
+
+
+    def get_cached(self, session_id: str) -> dict | None:
+        if self.cache is None:
             return None
+        return self.cache.get(session_id)
 
-        # redis.asyncio returns bytes so decode
+
+    async def fetch(self, session_id: str) -> dict | None:
+        '''
+        Decodes and returns user_id from redis.
+        '''
+        return self.load(session_id, await self.redis.get(self._key(session_id)))
+
+
+    async def fetch_with_state(self,
+                               session_id: str,
+                               prefix: str,
+                               suffix: str) -> tuple[dict | None, str | None, bytes | None, bytes | None]:
+        '''
+        Returns (session, user_id, raw state, raw seq) from redis in 1 script;
+        the state key is prefix + user_id + suffix.
+        user_id is the one the script parsed, None if it couldnt;
+        only trust the state if it matches the session's.
+        '''
+        reply = await run_script(self.redis, FETCH_WITH_STATE_SCRIPT,
+                                 [self._key(session_id)],
+                                 [prefix, suffix, self.user_id_prefix])
+        raw, user_id, state, seq = list(reply) + [None] * (4 - len(reply))
         if isinstance(user_id, bytes):
             user_id = user_id.decode('utf-8')
-        return json.loads(user_id)
+        return self.load(session_id, raw), user_id, state, seq
 
 
-    async def heartbeat(self, session_id: str):
+    def load(self, session_id: str, raw: bytes | None) -> dict | None:
+        '''
+        Decodes and caches a session read from redis.
+        '''
+        session = self.codec.decode(raw)
+        # dont cache misses; session may be created any moment
+        if session is not None and self.cache is not None:
+            self.cache.set(session_id, session)
+        return session
+
+
+    def invalidate(self, session_id: str):
+        if self.cache is not None:
+            self.cache.pop(session_id)
+
+
+    async def revoke(self, session_id: str):
+        await self.redis.delete(self._key(session_id))
+        self.invalidate(session_id)
+
+
+    def reissue(self, session_id: str) -> str | None:
+        '''
+        Returns a new session id to set after a heartbeat; None to keep it.
+        '''
+        return None
+
+
+    async def heartbeat(self, session_id: str) -> bool:
         '''
         Extends session by self.ttl every heartbeat.
+        Returns False if the session already expired.
         '''
         key = self._key(session_id)
-        if await self.redis.exists(key):
-            await self.redis.expire(key, self.ttl)
-            return True
-        return False
+        # EXPIRE returns 0 on a missing key, so no need for EXISTS
+        if self.heartbeats is not None:
+            ok = await self.heartbeats.expire(key)
+        else:
+            ok = bool(await self.redis.expire(key, self.ttl))
+
+        if not ok:
+            self.invalidate(session_id)
+        return ok
+
+
+class TokenSessionManager:
+    '''
+    Stateless sessions: the session id is an HMAC-signed token
+    carrying the user_id and an expiry, so checking it needs no redis call.
+
+    Tokens expire after ttl unless re-issued by a heartbeat.
+    Revoked tokens are kept in a redis denylist til they expire;
+    it is only checked on heartbeats, so revoking takes up to ttl.
+    '''
+    def __init__(self, redis: Redis, secret: str | None, ttl=SESSION_TTL):
+        if not secret:
+            raise ValueError('SESSION_SECRET is required for token sessions')
+        self.redis = redis
+        self.ttl = ttl
+        self._secret = secret.encode('utf-8')
+
+
+    def _sign(self, payload: bytes) -> bytes:
+        return hmac.new(self._secret, payload, hashlib.sha256).digest()
+
+
+    def _key(self, jti: str) -> str:
+        return f'session:revoked:{jti}'
+
+
+    def issue(self, user_id: str, jti: str | None = None) -> str:
+        claims = {
+            'user_id': user_id,
+            'exp': int(time.time()) + self.ttl,
+            'jti': jti or token_urlsafe(8),  # stays the same across re-issues
+        }
+        payload = json.dumps(claims, separators=(',', ':')).encode('utf-8')
+        return f'{_b64encode(payload)}.{_b64encode(self._sign(payload))}'
+
+
+    def verify(self, session_id: str) -> dict | None:
+        '''
+        Returns the token's claims if signed by us and unexpired.
+        '''
+        try:
+            payload, sig = (_b64decode(part) for part in session_id.split('.'))
+            if not hmac.compare_digest(sig, self._sign(payload)):
+                return None
+            claims = json.loads(payload)
+        except ValueError:
+            return None
+
+        if claims['exp'] < time.time():
+            return None
+        return claims
+
+
+    async def new_session(self, user_id: str) -> str:
+        return self.issue(user_id)
+
+
+    async def get(self, session_id: str) -> dict | None:
+        return self.get_cached(session_id)
+
+
+    # same interface as SessionManager, but never needs redis
+    def get_cached(self, session_id: str) -> dict | None:
+        claims = self.verify(session_id)
+        if claims is None:
+            return None
+        return {'user_id': claims['user_id']}
+
+
+    async def fetch(self, session_id: str) -> dict | None:
+        return self.get_cached(session_id)
+
+
+    async def heartbeat(self, session_id: str) -> bool:
+        claims = self.verify(session_id)
+        if claims is None:
+            return False
+        return not await self.redis.exists(self._key(claims['jti']))
+
+
+    def reissue(self, session_id: str) -> str | None:
+        '''
+        Returns the token w/ a fresh expiry; call after a heartbeat.
+        '''
+        claims = self.verify(session_id)
+        return self.issue(claims['user_id'], claims['jti'])
+
+
+    async def revoke(self, session_id: str):
+        claims = self.verify(session_id)
+        if claims is None:
+            return
+        # reissues keep the jti, so this covers every copy of the token
+        ttl = max(int(claims['exp'] - time.time()), 1) + self.ttl
+        await self.redis.set(self._key(claims['jti']), 1, ex=ttl)
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class HeartbeatBatcher:
+    '''
+    Coalesces the heartbeats of one event loop tick into 1 pipeline,
+    so N concurrent heartbeats cost 1 round trip instead of N.
+    '''
+    def __init__(self, redis: Redis, ttl: int = SESSION_TTL):
+        self.redis = redis
+        self.ttl = ttl
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._task: asyncio.Task | None = None
+
+
+    async def expire(self, key: str) -> bool:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        # 1st beat of the tick schedules the flush;
+        # the task only runs next tick, after the rest queued up
+        if not self._pending:
+            self._task = loop.create_task(self._flush())
+        self._pending.append((key, fut))
+        return await fut
+
+
+    async def _flush(self):
+        batch, self._pending = self._pending, []
+
+        # no MULTI; beats are independent
+        pipe = self.redis.pipeline(transaction=False)
+        for key, _ in batch:
+            pipe.expire(key, self.ttl)
 
+        try:
+            replies = await pipe.execute()
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
 
+        for (_, fut), reply in zip(batch, replies):
+            if not fut.done():
+                fut.set_result(bool(reply))
@@ -1,25 +1,15 @@
-from fastapi import Depends
 from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
 
-from .redis import get_redis
-from ..services.reset import get_current_epoch
 
-
-# called in api/games at every game start
-async def mark_played(game_id: str, redis=Depends(get_redis)):
+# called thru GameContext.mark_played at every game start
+def queue_mark_played(pipe: Pipeline, game_id: str, epoch: str):
     '''
-    Mark if the game has been played today.
+    Queues marking the game as played in epoch.
     '''
-    epoch = get_current_epoch()
-
     guard_key = f'game:{game_id}:played:{epoch}'
-    # set guard key only on first play of the day.
-    # True if guard key has been set today
-    if not await redis.set(guard_key, 1, nx=True):
-        return
-
-    # if first play of day, update last played epoch to now
-    await redis.set(f'game:{game_id}:last_played_epoch', epoch)
+    # set guard key only on first play of the day
+    pipe.set(guard_key, 1, nx=True)
 
 
 # called in services.save
@@ -29,12 +19,13 @@ async def incr_streak(game_id: str, prev_epoch: str, redis: Redis):
     '''
     #assert prev_epoch is not None
     streak_key = f'game:{game_id}:streak'
-    last_played = await redis.get(f'game:{game_id}:last_played_epoch')
-    if isinstance(last_played, bytes):
-        last_played = last_played.decode('utf-8')
+    # stats are saved in the background after reset, so today's players
+    # may have played already; check prev_epoch's own guard key,
+    # which is only deleted after saving
+    played = await redis.exists(f'game:{game_id}:played:{prev_epoch}')
 
-    # if last played == yesterday, then incr else reset
-    if last_played == prev_epoch:
+    # if played yesterday, then incr else reset
+    if played:
         await redis.incr(streak_key)
     else:
         await redis.set(streak_key, 0)
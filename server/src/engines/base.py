@@ -3,31 +3,259 @@ Interface for hot-swappable games
 '''
 from abc import ABC, abstractmethod
 import asyncio
+import json
 import redis.asyncio as Redis
 
+from ..config import PERSIST_RETRIES, LEASE_TTL, LEASE_POLL
+from ..services import lease
+from ..services.codec import JSONCodec, init_ref
+from ..services.reset import get_current_epoch
+from ..services.save import save_stats_to_db
+
+
+# published epoch data and the saved marker outlive the epoch for late workers
+EPOCH_DATA_TTL = 2 * 24 * 60 * 60
+
+
+class InitState:
+    '''
+    The epoch's init state, built once per epoch and shared by every new player:
+     - state: the dict; read-only
+     - ref: stored in redis for new players; a ref to the epoch
+       (services/codec.py), or the encoded state if that is shorter
+     - body: the rendered state as a JSON response body
+    '''
+    def __init__(self, epoch: str, state: dict, rendered: dict, codec: JSONCodec):
+        self.epoch = epoch
+        self.state = state
+        encoded = codec.encode(state)
+        ref = init_ref(epoch)
+        self.ref = ref if len(ref) < len(encoded) else encoded
+        self.body = json.dumps(rendered, separators=(',', ':')).encode('utf-8')
+
 
 class GameEngine(ABC):
     '''
     GameEngine follows the Singleton pattern and is user-state agonstic.
     User states are stored in GameStateStore.
     Class only holds truths shared by all players, like solution.
+
+    codec encodes player states for redis; override w/ a
+    MsgpackCodec of the state's keys to shrink them.
+
+    Resets happen in 2 steps so requests never wait on I/O:
+     - prepare(): fetch_epoch() ahead of the reset (services/scheduler.py)
+     - ensure_reset(): swaps it in w/ apply_epoch() and
+       persists the prev epoch's stats in the background
+
+    Both are coordinated across worker processes thru redis leases:
+    1 worker fetches and publishes the epoch's data for the rest to load,
+    and 1 worker persists the stats.
+
+    The live epoch is checkpointed in redis, so a restarted worker
+    resumes it w/o a fetch and still persists the stats of an epoch
+    that ended while it was down.
     '''
+    codec = JSONCodec()
+
     def __init__(self, game_id: str, redis: Redis, db_session_factory):
         self._game_id = game_id
         self._redis = redis
         self._db_session_factory = db_session_factory
         self._lock = asyncio.Lock()  # to prevent data races
         self._epoch: str | None = None
+        self._staged: dict[str, dict] = {}  # epoch -> data from prepare()
+        self._checkpoint: dict | None = None  # last run's, loaded on 1st reset
+        self.initial: InitState | None = None  # live epoch's init state
+        self._persists: set[asyncio.Task] = set()
 
 
-    @abstractmethod
     async def ensure_reset(self, cur_epoch: str) -> bool:
         '''
         Resets game state if self.epoch != cur_epoch.
         Returns True if it reset.
 
+        If cur_epoch was prepared, this is a swap w/o awaiting,
+        so there is no lock to wait on.
+        '''
+        # if in the same epoch, do nothing.
+        # older epoch means request straddled a reset the engine already did
+        if self._epoch is not None and cur_epoch <= self._epoch:
+            return False
+
+        if self._epoch is None and self._checkpoint is None:
+            # 1st reset since startup: pick up where the last run left off
+            self._checkpoint = await self._load_checkpoint()
+            if self._checkpoint.get('epoch') == cur_epoch:
+                self._staged.setdefault(cur_epoch, self._checkpoint['data'])
+
+        if cur_epoch not in self._staged:
+            # not prepared (1st run or scheduler missed it), so fetch now
+            async with self._lock:
+                # check again after lock just in case
+                if self._epoch == cur_epoch:
+                    return False
+                await self.prepare(cur_epoch)
+
+        # no awaits from here on, so only 1 request swaps
+        if self._epoch == cur_epoch:
+            return False
+
+        data = self._staged.pop(cur_epoch)
+        prev_epoch = self._epoch
+        if prev_epoch is not None:
+            self._persist_stats(prev_epoch, self.get_outof_metric())
+        elif self._checkpoint.get('epoch', cur_epoch) < cur_epoch:
+            # restarted after the checkpointed epoch ended; the saved
+            # marker skips this if another worker already persisted it
+            self._persist_stats(self._checkpoint['epoch'], self._checkpoint['outof'])
+
+        self.apply_epoch(data)
+        self._epoch = cur_epoch
+        state = self.init_state()
+        self.initial = InitState(cur_epoch, state, self.render(state), self.codec)
+        self._run_background(self._save_checkpoint(cur_epoch, self.get_outof_metric(), data))
+        # drop anything staged for past epochs
+        self._staged = {e: d for e, d in self._staged.items() if e > cur_epoch}
+        return True
+
+
+    async def warmup(self):
+        '''
+        Gets the engine hot before it takes traffic (main.py lifespan),
+        so the 1st player doesnt wait on the epoch's fetch.
+        Override to also prime caches; call super().warmup() 1st.
+        '''
+        await self.ensure_reset(get_current_epoch())
+
+
+    async def prepare(self, epoch: str):
+        '''
+        Fetches epoch's data ahead of time; the live epoch is untouched.
+        '''
+        if epoch in self._staged:
+            return
+        self._staged[epoch] = await self._load_shared(epoch)
+
+
+    def _epoch_key(self, epoch: str) -> str:
+        return f'engine:{self._game_id}:{epoch}'
+
+
+    async def _load_shared(self, epoch: str) -> dict:
+        '''
+        Returns epoch's data; only the lease holder runs fetch_epoch(),
+        the other workers wait for it to be published.
+        '''
+        key = self._epoch_key(epoch)
+        lease_key = f'{key}:lease'
+        while True:
+            data = await self._redis.get(key)
+            if data is not None:
+                return json.loads(data)
+
+            if await lease.acquire(self._redis, lease_key, LEASE_TTL):
+                try:
+                    data = await self.fetch_epoch(epoch)
+                    await self._redis.set(key, json.dumps(data), ex=EPOCH_DATA_TTL)
+                    return data
+                finally:
+                    # on failure, the next worker to poll takes over
+                    await lease.release(self._redis, lease_key)
+
+            await asyncio.sleep(LEASE_POLL)
+
+
+    def _checkpoint_key(self) -> str:
+        return f'engine:{self._game_id}:checkpoint'
+
+
+    async def _load_checkpoint(self) -> dict:
+        '''
+        Returns the last live epoch's {epoch, outof, data}, or {} if none.
+        '''
+        raw = await self._redis.get(self._checkpoint_key())
+        return json.loads(raw) if raw is not None else {}
+
+
+    async def _save_checkpoint(self, epoch: str, outof: int, data: dict):
+        '''
+        Saves the now live epoch; no TTL since the last run might
+        have been down for days. Every worker writes the same value.
+        '''
+        checkpoint = {'epoch': epoch, 'outof': outof, 'data': data}
+        try:
+            await self._redis.set(self._checkpoint_key(), json.dumps(checkpoint))
+        except Exception as e:
+            # only costs a fetch (+ a missed save) if the worker restarts
+            print(f'Failed to checkpoint {self._game_id} for {epoch}: {e!r}')
+
+
+    def _persist_stats(self, prev_epoch: str, outof: int):
+        self._run_background(self._save_stats(prev_epoch, outof))
+
+
+    def _run_background(self, coro):
+        # hold a ref so the task isnt garbage collected
+        task = asyncio.create_task(coro)
+        self._persists.add(task)
+        task.add_done_callback(self._persists.discard)
+
+
+    async def _save_stats(self, prev_epoch: str, outof: int):
+        '''
+        Retries since stats stay in redis until saved.
+        Only 1 worker saves; save_stats_to_db deletes the leaderboard,
+        so a 2nd save would overwrite the stats w/ an empty one.
+        '''
+        lease_key = f'{self._epoch_key(prev_epoch)}:saved'
+        # lease is held for all retries (1 + 2 + 4.. secs) on top of the saves
+        ttl = 2 ** PERSIST_RETRIES + PERSIST_RETRIES * LEASE_TTL
+        if not await lease.acquire(self._redis, lease_key, ttl):
+            return
+
+        for attempt in range(PERSIST_RETRIES):
+            try:
+                await save_stats_to_db(self._game_id,
+                                       prev_epoch,
+                                       outof,
+                                       self._redis,
+                                       self._db_session_factory)
+                # keep the lease as a marker so no one saves again
+                await lease.extend(self._redis, lease_key, EPOCH_DATA_TTL)
+                return
+            except Exception as e:
+                print(f'Failed to save {self._game_id} stats for {prev_epoch}: {e!r}')
+                await asyncio.sleep(2 ** attempt)
+
+        # let a restarted worker (or a manual save) try again
+        await lease.release(self._redis, lease_key)
+
+
+    async def wait_persisted(self):
+        '''
+        Waits for any background stats saves + checkpoints; called on shutdown.
+        '''
+        await asyncio.gather(*self._persists, return_exceptions=True)
+
+
+    @abstractmethod
+    async def fetch_epoch(self, epoch: str) -> dict:
+        '''
+        Returns the data shared by all players for epoch.
+        Must not touch the live epoch's fields and must be
+        JSON-serializable since it is published to other workers.
+
         Some games fetch init data here using
-        fetcher = lambda: provider(http_client).
+        fetcher = lambda epoch: provider(http_client).
+        '''
+        pass
+
+
+    @abstractmethod
+    def apply_epoch(self, data: dict):
+        '''
+        Makes fetch_epoch()'s data live; must not await.
         '''
         pass
 
@@ -52,6 +280,14 @@ class GameEngine(ABC):
         pass
 
 
+    def render(self, state: dict) -> dict:
+        '''
+        Returns the state as sent to the client;
+        override to add views derived from the engine's data.
+        '''
+        return state
+
+
     @abstractmethod
     def get_outof_metric(self) -> int:
         '''
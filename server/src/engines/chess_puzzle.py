@@ -3,13 +3,14 @@ Read engines/base.py for info.
 '''
 from collections.abc import Callable, Awaitable
 import redis.asyncio as Redis
-import asyncio
 import chess
 import io
 from math import ceil
 
 from .base import GameEngine
-from ..services.save import save_stats_to_db
+from ..config import POSITION_CACHE_SIZE
+from ..services.cache import LRUCache
+from ..services.codec import MsgpackCodec
 
 
 class ChessPuzzleEngine(GameEngine):
@@ -17,51 +18,46 @@ class ChessPuzzleEngine(GameEngine):
     Board must be given in FEN.
     Player moves and solutions must be in UCI.
     """
+    codec = MsgpackCodec(('piece', 'rating', 'fen', 'ply', 'score', 'gameover'))
+
     def __init__(self,
                  game_id: str,
                  redis: Redis,
                  db_session,
-                 fetcher: Callable[[], Awaitable[dict]]):
+                 fetcher: Callable[[str], Awaitable[dict]]):
         super().__init__(game_id, redis, db_session)
-        self._fetcher = fetcher   # = lambda: provider(http)
+        self._fetcher = fetcher   # = lambda epoch: provider(http) or queue.pop
         self.start_fen: str | None = None
         self.piece: str | None = None
         self.rating: int | None = None
         self.solution: list[str] | None = None
+        self.line: list[str] | None = None  # answer key: FEN after each ply
+        # players mostly reach the same few positions, so
+        # FEN -> (board, canonical FEN, legal UCI moves); see positions.stats()
+        self.positions = LRUCache(POSITION_CACHE_SIZE)
 
 
-    async def ensure_reset(self, cur_epoch: str) -> bool:
+    async def fetch_epoch(self, epoch: str) -> dict:
         '''
-        Ensures the engine fetches new puzzle after reset time.
-        Returns True if reset.
+        Fetches the epoch's puzzle.
         '''
-        # if in the same epoch, do nothing
-        if self._epoch == cur_epoch:
-            return False
-
-        async with self._lock:
-            # check again after lock just in case
-            if self._epoch == cur_epoch:
-                return False
-
-            prev_epoch = self._epoch
-            # on 1st run, no prev epoch so no persist
-            if prev_epoch is not None:
-                await save_stats_to_db(self._game_id,
-                                       prev_epoch,
-                                       self.get_outof_metric(),
-                                       self._redis,
-                                       self._db_session_factory)
-            # after b/c if persist fails, stats are not lost
-            self._epoch = cur_epoch
-
-            # fetch new puzzle and init
-            puzzle = await self._fetcher()
-            self.start_fen = puzzle['fen']
-            self.piece = puzzle['fen'].split()[1]  # 'w' or 'b'
-            self.rating = puzzle['rating']
-            self.solution = puzzle['solution']
-            return True
+        return await self._fetcher(epoch)
+
+
+    def apply_epoch(self, puzzle: dict):
+        self.start_fen = puzzle['fen']
+        self.piece = puzzle['fen'].split()[1]  # 'w' or 'b'
+        self.rating = puzzle['rating']
+        self.solution = puzzle['solution']
+        self.line = self._build_line()
+        self.positions.clear()
+
+
+    async def warmup(self):
+        await super().warmup()
+        # every player passes thru the solution's positions
+        for fen in self.line:
+            self._position(fen)
 
 
     def init_state(self) -> dict:
@@ -79,16 +75,40 @@ class ChessPuzzleEngine(GameEngine):
         if state['gameover']:
             return state
 
-        board = chess.Board(state['fen'])
+        # fast path: correct move from the expected position.
+        # puzzle is fixed for the epoch, so result is in the answer key
+        ply = state['ply']
+        if (ply < len(self.solution)
+                and action['move'] == self.solution[ply]
+                and state['fen'] == self.line[ply]):
+            ply += 1
+            return {
+                "piece": self.piece,
+                "rating": self.rating,
+                "fen": self.line[ply],
+                "ply": ply,
+                "score": state['score'] + 1,
+                "gameover": ply >= len(self.solution)
+            }
+
+        # only need python-chess to tell illegal from wrong
+        return self._update_board(state, action)
+
+
+    def _update_board(self, state: dict, action: dict) -> dict:
+        '''
+        update_state() w/o the answer key.
+        '''
+        board, fen, legal_moves = self._position(state['fen'])
 
         # if illegal move, return given state
         # cant do **state cuz it might contain one of the flags
-        move = chess.Move.from_uci(action['move'])  # chess.Move!!!
-        if move not in board.legal_moves:
+        move = action['move']  # UCI
+        if move not in legal_moves:
             return {
                 "piece": self.piece,
                 "rating": self.rating,
-                "fen": board.fen(),
+                "fen": fen,
                 "ply": state['ply'],
                 "score": state['score'],
                 "gameover": False,
@@ -97,11 +117,11 @@ class ChessPuzzleEngine(GameEngine):
 
         # if wrong move, score--
         ply = state['ply']
-        if ply >= len(self.solution) or move.uci() != self.solution[ply]:
+        if ply >= len(self.solution) or move != self.solution[ply]:
             return {
                 "piece": self.piece,
                 "rating": self.rating,
-                "fen": board.fen(),
+                "fen": fen,
                 "ply": ply,
                 "score": state['score'] - 1,
                 "gameover": False,
@@ -109,7 +129,9 @@ class ChessPuzzleEngine(GameEngine):
             }
 
         # correct; score++ and set up opponent's turn
-        board.push(move)
+        # cached boards are shared, so push on a copy
+        board = board.copy(stack=False)
+        board.push_uci(move)
         ply += 1
 
         # check if last move
@@ -129,10 +151,29 @@ class ChessPuzzleEngine(GameEngine):
         if state['gameover']:
             return state
 
+        # fast path: house move from the expected position
+        ply = state['ply']
+        if ply < len(self.solution) and state['fen'] == self.line[ply]:
+            return {
+                'piece': self.piece,
+                'rating': self.rating,
+                'fen': self.line[ply + 1],
+                'ply': ply + 1,
+                'score': state['score'],
+                'gameover': False,
+                'house_move': self.solution[ply]
+            }
+        return self._play_house_turn_board(state)
+
+
+    def _play_house_turn_board(self, state: dict):
+        '''
+        play_house_turn() w/o the answer key.
+        '''
         ply = state['ply']
         move = self.solution[ply]  # UCI!!!
 
-        board = chess.Board(state['fen'])
+        board = self._position(state['fen'])[0].copy(stack=False)
         board.push_uci(move)
 
         return {
@@ -146,6 +187,32 @@ class ChessPuzzleEngine(GameEngine):
         }
 
 
+    def _position(self, fen: str) -> tuple[chess.Board, str, frozenset[str]]:
+        '''
+        Returns the (cached) board, canonical FEN and legal UCI moves.
+        Don't push onto the returned board; copy it first.
+        '''
+        position = self.positions.get(fen)
+        if position is None:
+            board = chess.Board(fen)
+            legal_moves = frozenset(m.uci() for m in board.legal_moves)
+            position = (board, board.fen(), legal_moves)
+            self.positions.set(fen, position)
+        return position
+
+
+    def _build_line(self) -> list[str]:
+        '''
+        Returns the FEN after every ply of the solution; index == ply.
+        '''
+        board = chess.Board(self.start_fen)
+        line = [board.fen()]
+        for move in self.solution:
+            board.push_uci(move)
+            line.append(board.fen())
+        return line
+
+
     def get_outof_metric(self) -> int:
         '''
         X score / total nturns
@@ -1,60 +1,73 @@
 '''
 Read engines/base.py for info.
 '''
-import asyncio
+from collections import deque
+import hashlib
+import numpy as np
 import redis.asyncio as Redis
 
 from .base import GameEngine
-from ..services.save import save_stats_to_db
+from ..config import MINESWEEPER_NDIM, MINESWEEPER_MINES
+from ..services.codec import MsgpackCodec
+
+
+# render() tile values; 0-8 = no. adjacent mines
+HIDDEN = -1
+FLAG = -2
+MINE = 9
 
 
 class MinesweeperEngine(GameEngine):
     """
+    Every player gets the same ndim x ndim board per epoch, seeded by the epoch.
+    The board lives on the engine, so player states only hold bitsets
+    (bit i = tile i, row-major) of revealed and flagged tiles.
+    Bitsets are hex strings since boards can have more than 64 tiles.
+
+    Actions: {'reveal': i} or {'flag': i} (toggles); i = row * ndim + col.
     """
-    def __init__(self, game_id: str, redis: Redis, db_session):
+    codec = MsgpackCodec(('revealed', 'flagged', 'score', 'gameover', 'won'))
+
+    def __init__(self,
+                 game_id: str,
+                 redis: Redis,
+                 db_session,
+                 ndim: int = MINESWEEPER_NDIM,
+                 nmines: int = MINESWEEPER_MINES):
         super().__init__(game_id, redis, db_session)
-        self.ndim: int = 8
-        self.mines: list | None = None
+        self.ndim = ndim
+        self.nmines = nmines
+        self.ntiles = ndim * ndim
+        self.mines: np.ndarray | None = None   # bool per tile
+        self.counts: np.ndarray | None = None  # adjacent mines per tile
+        self.mine_mask = 0
+        self.safe_mask = 0  # every tile w/o a mine
+        # flood fills precomputed per epoch: zero tile -> its region's index,
+        # region -> mask of its zero tiles + their border
+        self.region_of: np.ndarray | None = None
+        self.region_masks: list[int] = []
 
 
-    async def ensure_reset(self, cur_epoch: str) -> bool:
-        '''
-        Ensures the engine fetches new puzzle after reset time.
-        Returns True if reset.
-        '''
-        # if in the same epoch, do nothing
-        if self._epoch == cur_epoch:
-            return False
-
-        async with self._lock:
-            # check again after lock just in case
-            if self._epoch == cur_epoch:
-                return False
-
-            prev_epoch = self._epoch
-            # on 1st run, no prev epoch so no persist
-            if prev_epoch is not None:
-                await save_stats_to_db(self._game_id,
-                                       prev_epoch,
-                                       self.get_outof_metric(),
-                                       self._redis,
-                                       self._db_session_factory)
-            # after b/c if persist fails, stats are not lost
-            self._epoch = cur_epoch
-
-            # fetch new data and init
-            self.mines = self.init_mines()
-            self._epoch = cur_epoch
-            return True
+    async def fetch_epoch(self, epoch: str) -> dict:
+        return {'mines': self.init_mines(epoch)}
+
+
+    def apply_epoch(self, data: dict):
+        mines = np.zeros(self.ntiles, dtype=bool)
+        mines[data['mines']] = True
+
+        self.mines = mines
+        self.counts = adjacency_counts(mines.reshape(self.ndim, self.ndim)).ravel()
+        self.mine_mask = to_mask(mines)
+        self.safe_mask = ((1 << self.ntiles) - 1) ^ self.mine_mask
+        self.region_of, self.region_masks = zero_regions(self.counts, mines, self.ndim)
 
 
     def init_state(self) -> dict:
-        mines = self.init_mines()
-        self.max_score = len(mines)
         return {
-            "mines": mines,
-            "seen_tiles": [],
-            "score": 0,         # no. mines correctly revealed
+            "revealed": '0',
+            "flagged": '0',
+            "score": 0,         # no. safe tiles revealed; flags dont score
             "gameover": False,
             "won": False
         }
@@ -64,27 +77,214 @@ class MinesweeperEngine(GameEngine):
         if state['gameover']:
             return state
 
-        score = state['score']
-        seen_tiles = state['seen_tiles']
+        revealed = int(state['revealed'], 16)
+        flagged = int(state['flagged'], 16)
+
+        tile = action.get('reveal', action.get('flag'))
+        if not isinstance(tile, int) or not 0 <= tile < self.ntiles:
+            return {**self._clean(state), 'illegal': True}
+        bit = 1 << tile
+
+        # revealed tiles cant be flagged and flagged tiles cant be revealed
+        if revealed & bit or ('reveal' in action and flagged & bit):
+            return {**self._clean(state), 'illegal': True}
+
+        gameover = won = False
+        if 'reveal' not in action:
+            flagged ^= bit
+        elif self.mines[tile]:
+            revealed |= bit
+            gameover = True
+        else:
+            revealed |= self._reveal(tile)
+            flagged &= ~revealed
+            won = gameover = revealed & self.safe_mask == self.safe_mask
 
-        # cont
         return {
-            "mines": state['mines'],
-            "seen_tiles": seen_tiles,
-            "score": score,
-            "gameover": False,
-            "won": False
+            "revealed": format(revealed, 'x'),
+            "flagged": format(flagged, 'x'),
+            "score": (revealed & self.safe_mask).bit_count(),
+            "gameover": gameover,
+            "won": won
         }
 
 
+    def _reveal(self, tile: int) -> int:
+        '''
+        Returns the mask of tiles revealed by clicking tile:
+        itself, or its whole zero region + border if it has no adjacent mines.
+        '''
+        region = self.region_of[tile]
+        if region < 0:
+            return 1 << tile
+        return self.region_masks[region]
+
+
+    def _flood_fill(self, tile: int) -> int:
+        '''
+        BFS version of _reveal(); kept to check and bench it against.
+        '''
+        if self.counts[tile] != 0:
+            return 1 << tile
+
+        seen = np.zeros(self.ntiles, dtype=bool)
+        seen[tile] = True
+        queue = deque([tile])
+        while queue:
+            i = queue.popleft()
+            if self.counts[i] != 0:
+                continue
+            for j in self._neighbours(i):
+                if not seen[j]:
+                    seen[j] = True
+                    queue.append(j)
+        return to_mask(seen)
+
+
+    def _neighbours(self, i: int):
+        row, col = divmod(i, self.ndim)
+        for r in range(max(row - 1, 0), min(row + 2, self.ndim)):
+            for c in range(max(col - 1, 0), min(col + 2, self.ndim)):
+                if r != row or c != col:
+                    yield r * self.ndim + c
+
+
+    def _clean(self, state: dict) -> dict:
+        # drop last action's flags
+        return {key: state[key] for key in self.codec.fields}
+
+
+    def render(self, state: dict) -> dict:
+        '''
+        Adds the board as the player sees it:
+        HIDDEN, FLAG, 0-8 adjacent mines, or MINE (shown once gameover).
+        '''
+        revealed = from_mask(int(state['revealed'], 16), self.ntiles)
+        flagged = from_mask(int(state['flagged'], 16), self.ntiles)
+
+        board = np.full(self.ntiles, HIDDEN, dtype=np.int8)
+        board[flagged] = FLAG
+        board[revealed] = self.counts[revealed]
+        if state['gameover']:
+            board[self.mines & ~flagged] = MINE
+        return {**state, 'ndim': self.ndim, 'board': board.tolist()}
+
+
     def get_outof_metric(self) -> int:
         if self.mines is None:
             raise RuntimeError('Engine not initialized')
-        return len(self.mines)
+        return self.ntiles - self.nmines
+
+
+    def init_mines(self, epoch: str) -> list[int]:
+        '''
+        Scatters mines across the grid; same epoch -> same mines.
+        '''
+        digest = hashlib.sha256(f'{self._game_id}:{epoch}'.encode('utf-8')).digest()
+        rng = np.random.default_rng(int.from_bytes(digest[:8], 'big'))
+        mines = rng.choice(self.ntiles, size=self.nmines, replace=False)
+        return sorted(int(i) for i in mines)
+
+
+def adjacency_counts(mines: np.ndarray) -> np.ndarray:
+    '''
+    Returns the no. mines around each tile of a 2d bool grid,
+    i.e. the grid convolved w/ a 3x3 kernel of 1s (minus the tile itself).
+    '''
+    padded = np.pad(mines.astype(np.int8), 1)
+    windows = np.lib.stride_tricks.sliding_window_view(padded, (3, 3))
+    return (windows.sum(axis=(2, 3)) - mines).astype(np.int8)
+
+
+# (row, col) offsets of the neighbours after a tile in row-major order;
+# together w/ their mirrors they cover all 8
+FORWARD = ((0, 1), (1, -1), (1, 0), (1, 1))
+
+
+def zero_regions(counts: np.ndarray,
+                 mines: np.ndarray,
+                 ndim: int) -> tuple[np.ndarray, list[int]]:
+    '''
+    Labels the 8-connected regions of safe tiles w/ no adjacent mines
+    (union-find over adjacent pairs). Returns:
+     - region_of: region index per tile, -1 if not a zero tile
+     - masks: per region, its tiles + the numbered tiles bordering it
+    '''
+    zero = ((counts == 0) & ~mines).reshape(ndim, ndim)
+    index = np.arange(ndim * ndim).reshape(ndim, ndim)
+
+    # every pair of adjacent zero tiles, found w/ shifted views of the grid
+    parent = list(range(ndim * ndim))  # list; much faster than numpy per element
+    for dr, dc in FORWARD:
+        a, b = _shifted_pairs(zero, zero, index, dr, dc)
+        for i, j in zip(a.tolist(), b.tolist()):
+            _union(parent, i, j)
+
+    zero_tiles = np.flatnonzero(zero)
+    roots = np.array([_find(parent, i) for i in zero_tiles.tolist()], dtype=np.int64)
+    labels, region_of_zero = np.unique(roots, return_inverse=True)
+    region_of = np.full(ndim * ndim, -1, dtype=np.int32)
+    region_of[zero_tiles] = region_of_zero
+
+    # (region, tile) for every zero tile and every tile next to one
+    grid = region_of.reshape(ndim, ndim)
+    safe = ~mines.reshape(ndim, ndim)
+    pairs = [(region_of[zero_tiles], zero_tiles)]
+    for dr, dc in FORWARD + tuple((-dr, -dc) for dr, dc in FORWARD):
+        a, b = _shifted_pairs(zero, safe, index, dr, dc)
+        pairs.append((grid.ravel()[a], b))
+    regions = np.concatenate([r for r, _ in pairs])
+    tiles = np.concatenate([t for _, t in pairs])
+
+    masks = []
+    nbytes = (ndim * ndim + 7) // 8
+    order = np.argsort(regions, kind='stable')
+    bounds = np.searchsorted(regions[order], np.arange(len(labels) + 1))
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        members = tiles[order[lo:hi]]
+        buf = np.zeros(nbytes, dtype=np.uint8)
+        np.bitwise_or.at(buf, members >> 3, (1 << (members & 7)).astype(np.uint8))
+        masks.append(int.from_bytes(buf.tobytes(), 'little'))
+    return region_of, masks
+
+
+def _shifted_pairs(src: np.ndarray,
+                   dst: np.ndarray,
+                   index: np.ndarray,
+                   dr: int,
+                   dc: int) -> tuple[np.ndarray, np.ndarray]:
+    '''
+    Returns flat indices (a, b) where src[a] and dst[b] and b = a + (dr, dc).
+    '''
+    n = src.shape[0]
+    rows_a = slice(max(-dr, 0), n - max(dr, 0))
+    cols_a = slice(max(-dc, 0), n - max(dc, 0))
+    rows_b = slice(max(dr, 0), n - max(-dr, 0))
+    cols_b = slice(max(dc, 0), n - max(-dc, 0))
+    both = src[rows_a, cols_a] & dst[rows_b, cols_b]
+    return index[rows_a, cols_a][both], index[rows_b, cols_b][both]
+
+
+def _find(parent: list[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]  # path halving
+        i = parent[i]
+    return i
+
+
+def _union(parent: list[int], i: int, j: int):
+    ri, rj = _find(parent, i), _find(parent, j)
+    if ri != rj:
+        parent[max(ri, rj)] = min(ri, rj)
 
 
-    def init_mines(self):
-        '''Randomly scatters mines across grid'''
-        return []
+def to_mask(tiles: np.ndarray) -> int:
+    '''
+    Packs a bool array into an int; bit i = tiles[i].
+    '''
+    return int.from_bytes(np.packbits(tiles, bitorder='little').tobytes(), 'little')
 
 
+def from_mask(mask: int, ntiles: int) -> np.ndarray:
+    raw = np.frombuffer(mask.to_bytes((ntiles + 7) // 8, 'little'), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder='little')[:ntiles].astype(bool)
@@ -1,13 +1,21 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, status
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import httpx
 import redis.asyncio as redis
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 from src.config import GAMES, REQUEST_TIMEOUT, REDIS_HOST, REDIS_PORT, DB_URL, b_TEST
-from src.depends.engine_reg import init_game_engine
+from src.config import STATE_CACHE_SIZE, STATS_CACHE_SIZE, LEADERBOARD_TTL
+from src.config import SESSION_CACHE_SIZE, SESSION_CACHE_TTL, SESSION_TTL
+from src.config import SESSION_BACKEND, SESSION_SECRET
+from src.depends.engine_reg import start_game_engine
+from src.depends.sessions import HeartbeatBatcher, TokenSessionManager
 from src.db.models.stats import Base
+from src.services.cache import LRUCache
+from src.services.scheduler import run_reset_scheduler
 
 from src.api.auth import router as auth_router
 from src.api.session import router as session_router
@@ -38,22 +46,47 @@ async def lifespan(app: FastAPI):
             host=REDIS_HOST,
             port=REDIS_PORT,
             db=0,  # db number (0-16)
-            decode_responses=True,  # retrn strings instead of bytes
+            decode_responses=False,  # bytes; states/sessions are binary (services/codec.py)
         )
         print('Redis startup: OK')
 
         app.state.http = httpx.AsyncClient(timeout=REQUEST_TIMEOUT)
         print('HTTP client startup: OK')
 
+    app.state.session_cache = LRUCache(SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+    app.state.heartbeats = HeartbeatBatcher(app.state.redis, SESSION_TTL)
+    # built once, so a missing SESSION_SECRET stops startup instead of 500ing every request
+    app.state.token_sessions = (TokenSessionManager(app.state.redis, SESSION_SECRET)
+                                if SESSION_BACKEND == 'token' else None)
+    app.state.state_cache = LRUCache(STATE_CACHE_SIZE)
+    app.state.stats_cache = LRUCache(STATS_CACHE_SIZE)
+    app.state.leaderboard_cache = LRUCache(len(GAMES) * 8, ttl=LEADERBOARD_TTL)
+
+    app.state.puzzle_queues = {}  # filled by init_game_engine
     app.state.engines = {}
-    for game_id in GAMES:
-        engine = await init_game_engine(game_id, app)
-        app.state.engines[game_id] = engine
-    print('Game Engines initialized')
+    app.state.ready = {}     # game_id -> warmed up; filled by start_game_engine
+    app.state.warmups = set()
+    # all at once, so startup takes as long as the slowest engine
+    await asyncio.gather(*(start_game_engine(game_id, app) for game_id in GAMES))
+    print(f'Game Engines initialized: {app.state.ready}')
+
+    reset_task = asyncio.create_task(run_reset_scheduler(app.state.engines))
+    prefetch_tasks = [asyncio.create_task(queue.run())
+                      for queue in app.state.puzzle_queues.values()]
+    print('Reset scheduler and puzzle prefetch started')
 
     yield
     print('Server shutting down...')
 
+    reset_task.cancel()
+    for task in app.state.warmups:
+        task.cancel()
+    for task in prefetch_tasks:
+        task.cancel()
+    for engine in app.state.engines.values():
+        await engine.wait_persisted()
+    print('Reset scheduler stopped')
+
     await app.state.http.aclose()
     print('HTTP client shutdown')
     await app.state.redis.aclose()
@@ -70,6 +103,19 @@ app.include_router(session_router)
 app.include_router(games_router)
 app.include_router(stats_router)
 
+# for load balancer health checks
+@app.get("/ready")
+async def ready() -> JSONResponse:
+    '''
+    200 once every engine is warmed up, 503 until then.
+    '''
+    engines = getattr(app.state, 'ready', {})
+    is_ready = bool(engines) and all(engines.values())
+    return JSONResponse({'ready': is_ready, 'engines': engines},
+                        status_code=status.HTTP_200_OK if is_ready
+                        else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
 # runs around every request (before/after)
 # apparently needed for Discord iframe
 app.add_middleware(
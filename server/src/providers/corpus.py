@@ -0,0 +1,220 @@
+'''
+Offline data provider for ChessPuzzleEngine.
+Serves puzzles from the lichess puzzle database CSV
+(https://database.lichess.org/#puzzles), so no network is needed.
+
+The CSV is never loaded into RAM: an index of row offsets grouped by
+rating band and theme is built once next to it (<csv>.idx), and both
+files are memory-mapped. Each epoch's puzzle is a seeded pick from a group.
+
+Prebuild the index w/ (from server/):
+    python -m src.providers.corpus path/to/lichess_db_puzzle.csv
+'''
+from array import array
+import asyncio
+import chess
+import csv
+import hashlib
+import json
+import mmap
+import os
+from pathlib import Path
+import struct
+import sys
+import tempfile
+
+from ..config import PUZZLE_CORPUS, CORPUS_RATING, CORPUS_THEME
+from .lichess import validate_puzzle
+
+
+INDEX_MAGIC = b'PZIDX1\n'
+BAND_WIDTH = 100      # rating bands: 1500 -> 'band:1500' == 1500..1599
+FLUSH_EVERY = 4096    # offsets buffered per group while building
+
+# CSV columns
+ID, FEN, MOVES, RATING, THEMES = 0, 1, 2, 3, 7
+
+
+def group_for(rating: int | None = None, theme: str | None = None) -> str:
+    '''
+    Returns the index group to pick from; theme wins over rating.
+    '''
+    if theme:
+        return f'theme:{theme}'
+    if rating is not None:
+        return f'band:{rating // BAND_WIDTH * BAND_WIDTH}'
+    return 'all'
+
+
+class PuzzleCorpus:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + '.idx')
+        if not self._index_fresh():
+            build_index(self.path, self.index_path)
+
+        self._csv = _mmap(self.path)
+        self._idx = _mmap(self.index_path)
+
+        # header = magic + 1 line JSON directory, then uint64 offsets
+        end = self._idx.find(b'\n', len(INDEX_MAGIC))
+        directory = json.loads(self._idx[len(INDEX_MAGIC):end])
+        self.groups: dict[str, list[int]] = directory['groups']  # name -> [start, count]
+        self._base = end + 1
+
+
+    def _index_fresh(self) -> bool:
+        if not self.index_path.exists():
+            return False
+        with open(self.index_path, 'rb') as f:
+            if f.readline() != INDEX_MAGIC:
+                return False
+            directory = json.loads(f.readline())
+        return directory['csv_size'] == self.path.stat().st_size
+
+
+    def count(self, group: str = 'all') -> int:
+        return self.groups.get(group, (0, 0))[1]
+
+
+    def pick(self, epoch: str, group: str = 'all') -> dict:
+        '''
+        Returns the epoch's puzzle from group; same epoch -> same puzzle.
+        '''
+        if self.count(group) == 0:
+            raise ValueError(f'No puzzles in corpus group {group}')
+        start, count = self.groups[group]
+
+        digest = hashlib.sha256(f'{group}:{epoch}'.encode('utf-8')).digest()
+        seed = int.from_bytes(digest[:8], 'big')
+
+        # skip broken rows deterministically
+        for i in range(min(count, 100)):
+            pos = self._base + 8 * (start + (seed + i) % count)
+            offset, = struct.unpack_from('<Q', self._idx, pos)
+            try:
+                return self._read(offset)
+            except ValueError as e:
+                print(f'Skipping corpus row at {offset}: {e}')
+        raise ValueError(f'No valid puzzles in corpus group {group}')
+
+
+    def _read(self, offset: int) -> dict:
+        end = self._csv.find(b'\n', offset)
+        line = self._csv[offset:end if end != -1 else len(self._csv)]
+        row = next(csv.reader([line.decode('utf-8')]))
+        return parse_row(row)
+
+
+def parse_row(row: list[str]) -> dict:
+    '''
+    Converts a CSV row to {id, fen, solution, rating}.
+    CSV FEN is before the opponent's move (1st of Moves),
+    but the engine starts on the player's turn.
+    '''
+    moves = row[MOVES].split()
+    board = chess.Board(row[FEN])
+    board.push_uci(moves[0])
+
+    fen = board.fen()
+    solution = moves[1:]  # UCI
+    validate_puzzle(fen, solution)
+
+    return {
+        'id': row[ID],
+        'fen': fen,
+        'solution': solution,
+        'rating': int(row[RATING])
+    }
+
+
+def build_index(path: Path, index_path: Path):
+    '''
+    Streams the CSV once; offsets are spilled to 1 temp file per group,
+    so memory stays bounded no matter the CSV size.
+    '''
+    print(f'Building puzzle index for {path}...')
+    with tempfile.TemporaryDirectory(dir=index_path.parent) as tmp:
+        spills = {}   # group -> file
+        buffers = {}  # group -> array of offsets
+
+        def add(group: str, offset: int):
+            buf = buffers.setdefault(group, array('Q'))
+            buf.append(offset)
+            if len(buf) >= FLUSH_EVERY:
+                flush(group)
+
+        def flush(group: str):
+            if group not in spills:
+                spills[group] = open(Path(tmp) / f'{len(spills)}.bin', 'w+b')
+            buffers[group].tofile(spills[group])
+            del buffers[group][:]
+
+        with open(path, 'rb') as f:
+            offset = 0
+            for line in f:
+                start, offset = offset, offset + len(line)
+                row = next(csv.reader([line.decode('utf-8')]), None)
+                # skip header and blank/short rows
+                if not row or len(row) <= THEMES or not row[RATING].isdigit():
+                    continue
+
+                add('all', start)
+                add(group_for(rating=int(row[RATING])), start)
+                for theme in row[THEMES].split():
+                    add(group_for(theme=theme), start)
+
+        for group in list(buffers):
+            flush(group)
+
+        # directory: group -> [start, count] in no. offsets
+        groups, start = {}, 0
+        for group, spill in spills.items():
+            count = spill.tell() // 8
+            groups[group] = [start, count]
+            start += count
+
+        directory = {'csv_size': path.stat().st_size, 'groups': groups}
+        # unique per build, so workers building at once dont share it
+        tmp_index = Path(tmp) / 'index'
+        with open(tmp_index, 'wb') as out:
+            out.write(INDEX_MAGIC)
+            out.write(json.dumps(directory).encode('utf-8') + b'\n')
+            for spill in spills.values():
+                spill.seek(0)
+                while chunk := spill.read(1 << 20):
+                    out.write(chunk)
+                spill.close()
+        # atomic (same dir as index_path), so no half-built index;
+        # concurrent builds are identical, so the last one wins
+        os.replace(tmp_index, index_path)
+
+    print(f'Puzzle index built: {groups.get("all", (0, 0))[1]} puzzles')
+
+
+def _mmap(path: Path) -> mmap.mmap:
+    with open(path, 'rb') as f:
+        # mapping stays valid after the file is closed
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+_corpus: PuzzleCorpus | None = None
+_corpus_lock = asyncio.Lock()
+
+
+# http_client unused; same signature as the lichess providers
+async def fetch_corpus_puzzle(http_client, epoch: str | None = None) -> dict:
+    '''
+    Returns the epoch's puzzle from the local corpus (config.PUZZLE_CORPUS).
+    '''
+    global _corpus
+    if _corpus is None:
+        async with _corpus_lock:
+            if _corpus is None:
+                # indexing the full DB takes secs; keep the event loop free
+                _corpus = await asyncio.to_thread(PuzzleCorpus, PUZZLE_CORPUS)
+    return _corpus.pick(epoch, group_for(CORPUS_RATING, CORPUS_THEME))
+
+
+if __name__ == '__main__':
+    PuzzleCorpus(sys.argv[1] if len(sys.argv) > 1 else PUZZLE_CORPUS)
@@ -11,11 +11,13 @@ from ..config import LICHESS_SECRET, b_TEST
 
 TEST_URL = "https://lichess.org/api/puzzle/00sJ9"
 API_URL = "https://lichess.org/api/puzzle/daily"
-#API_URL = "https://lichess.org/api/puzzle/next"
+NEXT_URL = "https://lichess.org/api/puzzle/next"
 
 
-# http_client is currently httpx.AsyncClient but can be swapped
-async def fetch_daily_puzzle(http_client) -> dict:
+# http_client is currently httpx.AsyncClient but can be swapped.
+# providers are called as provider(http_client, epoch);
+# lichess picks the puzzle itself so epoch is ignored
+async def fetch_daily_puzzle(http_client, epoch: str | None = None) -> dict:
     '''
     Returns the lichess daily puzzle.
     '''
@@ -39,8 +41,34 @@ async def fetch_daily_puzzle(http_client) -> dict:
 
     if r.status_code != 200:
         raise error(r.status_code, 'Failed to fetch daily chess puzzle')
-    data = r.json()
+    return parse_puzzle(r.json())
 
+
+# lichess only serves today's daily puzzle,
+# so puzzles queued ahead of time (providers/prefetch.py) come from here
+async def fetch_next_puzzle(http_client, epoch: str | None = None) -> dict:
+    '''
+    Returns a new lichess puzzle.
+    '''
+    # if authenticated, lichess only serves puzzles the account hasnt seen
+    headers={
+        "Authorization": f"Bearer {LICHESS_SECRET}"
+    } if LICHESS_SECRET else {}
+
+    if b_TEST:
+        r = await http_client.get(TEST_URL)
+    else:
+        r = await http_client.get(NEXT_URL, headers=headers)
+
+    if r.status_code != 200:
+        raise error(r.status_code, 'Failed to fetch next chess puzzle')
+    return parse_puzzle(r.json())
+
+
+def parse_puzzle(data: dict) -> dict:
+    '''
+    Converts a lichess API puzzle to {id, fen, solution, rating}.
+    '''
     # check lichess api docs
     pgn = data['game']['pgn']
     init_ply = data['puzzle']['initialPly']
@@ -48,15 +76,29 @@ async def fetch_daily_puzzle(http_client) -> dict:
     solution = data['puzzle']['solution']
 
     fen = pgn_to_fen(pgn, init_ply)
-    print(fen, solution, rating)
+    validate_puzzle(fen, solution)
 
     return {
+        'id': data['puzzle']['id'],
         'fen': fen,
         'solution': solution,  # UCI
         'rating': rating
     }
 
 
+def validate_puzzle(fen: str, solution: list[str]):
+    '''
+    Raises ValueError if the solution can't be played from fen.
+    '''
+    board = chess.Board(fen)
+    if not solution:
+        raise ValueError('Puzzle has no solution')
+    for move in solution:
+        if chess.Move.from_uci(move) not in board.legal_moves:
+            raise ValueError(f'Illegal solution move {move} in {board.fen()}')
+        board.push_uci(move)
+
+
 def pgn_to_fen(pgn: str, init_ply: int) -> str:
     '''
     convert Portable-Game -> Forsynth-Edwards
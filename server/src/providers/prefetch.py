@@ -0,0 +1,88 @@
+'''
+Redis queue of upcoming puzzles, filled in the background,
+so resets pop a ready puzzle instead of waiting on the provider.
+
+Shared by all workers. Only the worker holding an epoch's lease pops
+(GameEngine.fetch_epoch), and the puzzle is published w/ the rest of the
+epoch's data (GameEngine._load_shared), so every epoch pops 1 puzzle.
+Every worker runs the filler, but only the one holding the queue's lease
+tops it up, so concurrent fills cant push past the size.
+'''
+from collections.abc import Callable, Awaitable
+import asyncio
+import json
+import redis.asyncio as Redis
+
+from ..config import PREFETCH_SIZE, PREFETCH_INTERVAL, LEASE_TTL
+from ..services import lease
+
+
+class PuzzleQueue:
+    '''
+    fetcher = lambda: provider(http_client, None); must return
+    converted and validated puzzles (JSON-serializable dicts).
+    '''
+    def __init__(self,
+                 game_id: str,
+                 redis: Redis,
+                 fetcher: Callable[[], Awaitable[dict]],
+                 size: int = PREFETCH_SIZE):
+        self._game_id = game_id
+        self._redis = redis
+        self._fetcher = fetcher
+        self.size = size
+
+
+    def _key(self) -> str:
+        return f'puzzles:{self._game_id}:queue'
+
+
+    # epoch unused; same signature as the engine's fetcher
+    async def pop(self, epoch: str | None = None) -> dict:
+        '''
+        Returns the next puzzle; one redis call unless the queue ran dry.
+        '''
+        puzzle = await self._redis.lpop(self._key())
+        if puzzle is not None:
+            return json.loads(puzzle)
+
+        print(f'Puzzle queue empty for {self._game_id}, fetching')
+        return await self._fetcher()
+
+
+    async def fill(self) -> int:
+        '''
+        Tops the queue up to self.size; returns no. puzzles added.
+        Skipped (0) while another worker fills it.
+        '''
+        lease_key = f'{self._key()}:lease'
+        if not await lease.acquire(self._redis, lease_key, LEASE_TTL):
+            return 0
+
+        added = 0
+        try:
+            # only pops happen meanwhile, so 1 LLEN cant overshoot
+            missing = self.size - await self._redis.llen(self._key())
+            while added < missing:
+                puzzle = await self._fetcher()
+                # lease expired mid fetch; another worker may be filling
+                if not await lease.extend(self._redis, lease_key, LEASE_TTL):
+                    break
+                await self._redis.rpush(self._key(), json.dumps(puzzle))
+                added += 1
+        finally:
+            await lease.release(self._redis, lease_key)
+        return added
+
+
+    # started by main.py lifespan
+    async def run(self, interval: float = PREFETCH_INTERVAL):
+        '''
+        Keeps the queue filled; a failed fill is retried next interval.
+        '''
+        while True:
+            try:
+                await self.fill()
+            except Exception as e:
+                print(f'Failed to fill puzzle queue for {self._game_id}: {e!r}')
+            await asyncio.sleep(interval)
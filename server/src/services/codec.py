@@ -0,0 +1,93 @@
+'''
+Codecs for dict values stored in redis (game states, sessions).
+
+Binary values start with a 2 byte header: MAGIC + codec version.
+MAGIC (0xc1) is never produced by msgpack and can't start a JSON document,
+so values without it are read as JSON; this keeps old values readable
+while they expire.
+
+Version INIT_REF marks a reference to the epoch's shared init state
+(engines/base.py InitState) instead of an encoded state.
+'''
+import json
+import msgpack
+
+
+MAGIC = 0xc1
+INIT_REF = 0xff
+
+
+def init_ref(epoch: str) -> bytes:
+    '''
+    Returns the value stored for a player still on epoch's init state.
+    '''
+    return bytes([MAGIC, INIT_REF]) + epoch.encode('utf-8')
+
+
+def is_init_ref(raw: bytes | str) -> bool:
+    if isinstance(raw, str):
+        raw = raw.encode('utf-8')
+    return raw[:2] == bytes([MAGIC, INIT_REF])
+
+
+class JSONCodec:
+    '''
+    Plain JSON, no header. Version 0.
+    '''
+    version = 0
+
+
+    def encode(self, obj: dict) -> bytes:
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+    def decode(self, raw: bytes | str | None) -> dict | None:
+        if raw is None:
+            return None
+
+        # redis.asyncio returns bytes
+        if isinstance(raw, str):
+            raw = raw.encode('utf-8')
+
+        if raw[:1] != bytes([MAGIC]):
+            return json.loads(raw)
+
+        version = raw[1]
+        if version != self.version:
+            raise ValueError(f'Unknown codec version: {version}')
+        return self._unpack(raw[2:])
+
+
+    def _unpack(self, payload: bytes) -> dict:
+        return json.loads(payload)
+
+
+class MsgpackCodec(JSONCodec):
+    '''
+    Packs a dict as a msgpack array in schema order, so keys aren't stored.
+    Keys outside the schema (i.e. one-off flags like 'wrong') are
+    appended as a trailing map; missing schema keys decode as None.
+
+    Bump version whenever fields change.
+    '''
+    def __init__(self, fields: tuple[str, ...], version: int = 1):
+        self.fields = fields
+        self._field_set = frozenset(fields)
+        self.version = version
+        self.header = bytes([MAGIC, version])
+
+
+    def encode(self, obj: dict) -> bytes:
+        row = [obj.get(f) for f in self.fields]
+        extras = {k: v for k, v in obj.items() if k not in self._field_set}
+        if extras:
+            row.append(extras)
+        return self.header + msgpack.packb(row)
+
+
+    def _unpack(self, payload: bytes) -> dict:
+        row = msgpack.unpackb(payload)
+        obj = dict(zip(self.fields, row))
+        if len(row) > len(self.fields):
+            obj.update(row[-1])
+        return obj
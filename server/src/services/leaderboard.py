@@ -1,13 +1,132 @@
 import redis.asyncio as Redis
 
+from ..config import GAMES
+from .reset import seconds_since_reset
+from .scripts import run_script
+
+
+# top K + the player's rank and the players around them, in 1 round trip.
+# ARGV: user_id, top K (0 to skip), players on each side, '1' if desc
+READ_SCRIPT = '''
+local desc = ARGV[4] == '1'
+local range = desc and 'ZREVRANGE' or 'ZRANGE'
+local top, around = {}, {}
+
+local k = tonumber(ARGV[2])
+if k > 0 then
+    top = redis.call(range, KEYS[1], 0, k - 1, 'WITHSCORES')
+end
+
+local rank = redis.call(desc and 'ZREVRANK' or 'ZRANK', KEYS[1], ARGV[1])
+if rank then
+    local n = tonumber(ARGV[3])
+    local lo = math.max(rank - n, 0)
+    around = redis.call(range, KEYS[1], lo, rank + n, 'WITHSCORES')
+    around = {lo, around}
+else
+    rank = -1
+end
+
+return {top, rank, around, redis.call('ZCARD', KEYS[1])}
+'''
+
+
+def leaderboard_key(game_id: str, epoch: str) -> str:
+    return f'game:{game_id}:leaderboard:{epoch}'
+
+
+# scores are packed w/ the secs into the epoch they were set at,
+# so ZRANGE breaks ties by who got there 1st w/o any extra lookups.
+# packed = score * 2^TIE_BITS + tiebreak; exact in a double for |score| < 2^35
+TIE_BITS = 17  # 2^17 secs > 1 day
+TIE_MAX = (1 << TIE_BITS) - 1
+
+
+def is_desc(game_id: str) -> bool:
+    return GAMES[game_id]['rank_order'] == 'desc'
+
+
+def pack_score(score: int, elapsed: int, desc: bool) -> int:
+    '''
+    Returns score w/ elapsed (secs into the epoch) as tiebreak;
+    earlier always ranks higher.
+    '''
+    elapsed = min(max(elapsed, 0), TIE_MAX)
+    return (score << TIE_BITS) + (TIE_MAX - elapsed if desc else elapsed)
+
+
+def unpack_score(packed: float | bytes | str) -> int:
+    return int(float(packed)) >> TIE_BITS
+
+
+def _zadd_args(game_id: str, user_id: str, score: int) -> dict:
+    # GT/LT: only a better score (or same score sooner) is written
+    desc = is_desc(game_id)
+    return {
+        'mapping': {user_id: pack_score(score, seconds_since_reset(), desc)},
+        'gt': desc,
+        'lt': not desc,
+    }
+
 
 async def rank_player(game_id: str,
                       user_id: str,
                       epoch: str,
                       score: int,
                       redis: Redis):
-    key = f'game:{game_id}:leaderboard:{epoch}'
-    # game could prio lower scores or higher scores,
-    # so no preferential adding
-    await redis.zadd(key, {user_id: score})
+    '''
+    Keeps the player's best score of the epoch, per the game's rank_order.
+    '''
+    key = leaderboard_key(game_id, epoch)
+    await redis.zadd(key, **_zadd_args(game_id, user_id, score))
+
+
+def rank_args(game_id: str,
+              user_id: str,
+              epoch: str,
+              score: int) -> tuple[str, list]:
+    '''
+    Same as rank_player() but as (key, [score, user_id, 'GT' | 'LT'])
+    for a script's ZADD (depends/game_states.py COMMIT_SCRIPT).
+    '''
+    desc = is_desc(game_id)
+    packed = pack_score(score, seconds_since_reset(), desc)
+    return leaderboard_key(game_id, epoch), [packed, user_id, 'GT' if desc else 'LT']
+
+
+async def read_leaderboard(game_id: str,
+                           user_id: str,
+                           epoch: str,
+                           top: int,
+                           around: int,
+                           desc: bool,
+                           redis: Redis) -> dict:
+    '''
+    Returns the live leaderboard as seen by user_id; ranks start at 1.
+    top=0 skips the top K, i.e. if the caller has it cached.
+    '''
+    top_flat, rank, around_reply, players = await run_script(
+        redis, READ_SCRIPT,
+        [leaderboard_key(game_id, epoch)],
+        [user_id, top, around, '1' if desc else '0'],
+    )
+
+    neighbours = []
+    if around_reply:
+        lo, around_flat = around_reply
+        neighbours = _entries(around_flat, lo)
+
+    return {
+        'top': _entries(top_flat, 0) if top > 0 else None,
+        'rank': rank + 1 if rank >= 0 else None,
+        'around': neighbours,
+        'players': players,
+    }
+
 
+def _entries(flat: list, start: int) -> list[dict]:
+    # lua returns WITHSCORES as a flat [member, score, ..] list
+    return [{'rank': start + i + 1,
+             'user_id': member.decode('utf-8') if isinstance(member, bytes) else member,
+             'score': unpack_score(score)}
+            for i, (member, score) in enumerate(zip(flat[::2], flat[1::2]))]
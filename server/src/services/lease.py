@@ -0,0 +1,42 @@
+'''
+Redis leases so only 1 worker process does a job (i.e. fetch, persist).
+'''
+import os
+import socket
+import redis.asyncio as Redis
+from secrets import token_urlsafe
+
+from .scripts import run_script
+
+
+# unique per process, so a worker only releases its own leases
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}:{token_urlsafe(4)}'
+
+# delete/extend only if still the owner; lease may have expired and moved on
+RELEASE_SCRIPT = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+'''
+EXTEND_SCRIPT = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+'''
+
+
+async def acquire(redis: Redis, key: str, ttl: int) -> bool:
+    '''
+    Returns True if this worker now holds the lease for ttl secs.
+    '''
+    return bool(await redis.set(key, WORKER_ID, nx=True, ex=ttl))
+
+
+async def release(redis: Redis, key: str) -> bool:
+    return bool(await run_script(redis, RELEASE_SCRIPT, [key], [WORKER_ID]))
+
+
+async def extend(redis: Redis, key: str, ttl: int) -> bool:
+    return bool(await run_script(redis, EXTEND_SCRIPT, [key], [WORKER_ID, ttl]))
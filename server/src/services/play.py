@@ -0,0 +1,135 @@
+'''
+Game turns shared by the REST (api/games.py) and websocket endpoints.
+Each takes the request's GameContext and commits its writes in 1 round trip
+(a pipeline, or the state commit script).
+'''
+from ..engines.base import GameEngine
+from ..depends.game_context import GameContext
+from .reset import get_current_epoch, seconds_til_next_reset
+from .error import error
+
+
+async def start_game(engine: GameEngine, ctx: GameContext, user_id: str) -> dict:
+    '''
+    Returns the user's state for today, creating it if needed.
+    Returns engine.initial.state itself if the user hasnt moved yet.
+    '''
+    epoch = get_current_epoch()
+    is_reset = await engine.ensure_reset(epoch)
+
+    # order matters in case user plays close to reset
+    # want state to timeout first
+    ttl = seconds_til_next_reset()
+
+    # checks if streak should be incremented
+    ctx.mark_played(epoch)
+
+    # only overwrites an existing state if the game just reset.
+    # new players get a ref to the epoch's shared init state
+    return await ctx.init_state(user_id, epoch, engine.initial.ref, ttl,
+                                overwrite=is_reset)
+
+
+async def play_update(engine: GameEngine,
+                      ctx: GameContext,
+                      user_id: str,
+                      action: dict,
+                      state: dict | None = None) -> dict:
+    '''
+    Returns the state after the player's action.
+    state=None loads the stored state.
+    '''
+    # get ttl here so its consistent with current epoch.
+    # otherwise, might store w/ next epoch's ttl.
+    epoch = get_current_epoch()
+    ttl = seconds_til_next_reset()
+
+    # in case game resets during play
+    await check_reset(engine, epoch)
+
+    if state is None:
+        state = await load_state(ctx, user_id, epoch)
+    state = engine.update_state(state, action)
+
+    # w/ the live leaderboard update
+    await ctx.store_state(user_id, epoch, state, ttl, state['score'])
+    return state
+
+
+async def play_house_turn(engine: GameEngine,
+                          ctx: GameContext,
+                          user_id: str,
+                          state: dict | None = None) -> dict:
+    '''
+    Returns the state after the house turn.
+    state=None loads the stored state.
+    '''
+    epoch = get_current_epoch()
+    ttl = seconds_til_next_reset()
+
+    await check_reset(engine, epoch)
+
+    if state is None:
+        state = await load_state(ctx, user_id, epoch)
+    state = engine.play_house_turn(state)
+    await ctx.store_state(user_id, epoch, state, ttl)
+    return state
+
+
+async def play_actions(engine: GameEngine,
+                       ctx: GameContext,
+                       user_id: str,
+                       actions: list[dict],
+                       game_config: dict,
+                       state: dict | None = None) -> tuple[dict, list[dict]]:
+    '''
+    Plays actions in order, each followed by the house turn if the game
+    has one, and stores only the final state.
+    Returns the final state and the state after every step;
+    stops early on gameover.
+    '''
+    epoch = get_current_epoch()
+    ttl = seconds_til_next_reset()
+
+    await check_reset(engine, epoch)
+
+    if state is None:
+        state = await load_state(ctx, user_id, epoch)
+
+    steps = []
+    for action in actions:
+        if state.get('gameover'):
+            break
+        state = engine.update_state(state, action)
+        steps.append(state)
+        if wants_house_turn(game_config, state):
+            state = engine.play_house_turn(state)
+            steps.append(state)
+
+    if steps:
+        # 1 write for the whole batch
+        await ctx.store_state(user_id, epoch, state, ttl, state['score'])
+    return state, steps
+
+
+def wants_house_turn(game_config: dict, state: dict) -> bool:
+    '''
+    True if the house should reply to the player's last move.
+    '''
+    return (game_config.get('hasHouseTurn', False)
+            and not state.get('wrong')
+            and not state.get('illegal')
+            and not state.get('gameover'))
+
+
+async def check_reset(engine: GameEngine, epoch: str):
+    if await engine.ensure_reset(epoch):
+        raise error(409, 'Game reset, restart required')
+
+
+async def load_state(ctx: GameContext, user_id: str, epoch: str) -> dict:
+    state = await ctx.load_state(user_id, epoch)
+    # expired at reset or never started
+    if state is None:
+        raise error(409, 'Game reset, restart required')
+    return state
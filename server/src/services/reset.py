@@ -7,8 +7,27 @@ def get_current_epoch() -> str:
     """
     Returns the current epoch as YYYY-MM-DD (UTC).
     """
+    return _epoch_date().isoformat()  # .iso for json-serializable
+
+
+def get_next_epoch() -> str:
+    """
+    Returns the epoch after the current one.
+    """
+    return (_epoch_date() + timedelta(days=1)).isoformat()
+
+
+def get_prev_epoch() -> str:
+    """
+    Returns the epoch before the current one, i.e. the last one persisted.
+    """
+    return (_epoch_date() - timedelta(days=1)).isoformat()
+
+
+def _epoch_date():
+    # epochs roll over at GAME_RESET_HOUR, not midnight
     now = datetime.now(timezone.utc)
-    return now.date().isoformat()  # .iso for json-serializable
+    return (now - timedelta(hours=GAME_RESET_HOUR)).date()
 
 
 def seconds_til_next_reset() -> int:
@@ -29,3 +48,10 @@ def seconds_til_next_reset() -> int:
 
     return int((next_reset-now).total_seconds())
 
+
+
+def seconds_since_reset() -> int:
+    '''
+    Returns secs into the current epoch.
+    '''
+    return 24 * 60 * 60 - seconds_til_next_reset()
@@ -1,12 +1,14 @@
 from datetime import datetime
 import redis.asyncio as Redis
 from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy import delete
 from sqlalchemy.dialects.postgresql import insert
 
-from ..config import GAMES
+from ..config import GAMES, PERSIST_CHUNK
 from .error import error
-from ..db.models.stats import Stats
+from ..db.models.stats import Stats, Ranking
 from ..depends.streak import incr_streak
+from .leaderboard import leaderboard_key, unpack_score
 
 
 # called by GameEngine().ensure_reset()
@@ -22,60 +24,88 @@ async def save_stats_to_db(game_id: str,
     await incr_streak(game_id, prev_epoch, redis)
     streak = await redis.get(f'game:{game_id}:streak')
 
-    leaderboard_key = f'game:{game_id}:leaderboard:{prev_epoch}'
+    lb_key = leaderboard_key(game_id, prev_epoch)
 
     order = GAMES[game_id]['rank_order']
     if order not in ('asc', 'desc'):
         raise error(401, 'Invalid rank order')
 
-    if order == 'asc':
-        rankings = await redis.zrange(
-            leaderboard_key, 0, -1, withscores=True
-        )
-    else:
-        rankings = await redis.zrevrange(
-            leaderboard_key, 0, -1, withscores=True
-        )
-
-    # decode_responses=True in redis settings so technically dont need to decode
-    rankings_list = [
-        {'user_id': user_id.decode('utf-8') if isinstance(user_id, bytes) else user_id,
-         'score': int(score)}
-        for user_id, score in rankings
-    ]
-
-    stats = Stats(
-        game_id=game_id,
-        date=epoch_to_datetime(prev_epoch),
-        rankings=rankings_list,
-        outof=outof,
-        streak=int(streak) if streak else 0
-    )
+    date = epoch_to_datetime(prev_epoch)
+    streak = int(streak) if streak else 0
 
     async with db_session_factory() as db_session:
         async with db_session.begin():
+            # re-saving an epoch (i.e. retried after commit) must not duplicate ranks
+            await db_session.execute(
+                delete(Ranking)
+                .where(Ranking.game_id == game_id, Ranking.date == date)
+            )
+
+            # page thru the leaderboard so only 1 chunk is ever in memory
+            players = 0
+            async for chunk in iter_rankings(lb_key, order, redis):
+                # list of params -> executemany, batched by the driver
+                await db_session.execute(insert(Ranking), [
+                    {'game_id': game_id,
+                     'date': date,
+                     'rank': players + i + 1,
+                     'user_id': user_id,
+                     'score': score}
+                    for i, (user_id, score) in enumerate(chunk)
+                ])
+                players += len(chunk)
+
             stmt = insert(Stats).values(
                 game_id=game_id,
-                date=epoch_to_datetime(prev_epoch),
-                rankings=rankings_list,
+                date=date,
+                players=players,
                 outof=outof,
-                streak=int(streak) if streak else 0,
+                streak=streak,
             ).on_conflict_do_update(
-                index_elements=[Stats.game_id],
+                index_elements=[Stats.game_id, Stats.date],
                 set_={
-                    "date": epoch_to_datetime(prev_epoch),
-                    "rankings": rankings_list,
+                    "players": players,
                     "outof": outof,
-                    "streak": int(streak) if streak else 0,
+                    "streak": streak,
                 },
             )
             await db_session.execute(stmt)
 
+    # invalidates cached /api/stats responses on every worker
+    await redis.incr(stats_version_key(game_id))
+
     # del after saving in case db fails
     # delete yesterday's stats since no TTL
     guard_key = f'game:{game_id}:played:{prev_epoch}'
     await redis.delete(guard_key)
-    await redis.delete(leaderboard_key)
+    await redis.delete(lb_key)
+
+
+def stats_version_key(game_id: str) -> str:
+    return f'stats:{game_id}:version'
+
+
+async def iter_rankings(lb_key: str,
+                        order: str,
+                        redis: Redis,
+                        chunk_size: int = PERSIST_CHUNK):
+    '''
+    Yields the leaderboard best first as lists of (user_id, score),
+    chunk_size at a time.
+    '''
+    start = 0
+    while True:
+        rankings = await redis.zrange(lb_key, start, start + chunk_size - 1,
+                                      desc=(order == 'desc'), withscores=True)
+        if not rankings:
+            return
+        # decode_responses=False in redis settings so decode
+        yield [(user_id.decode('utf-8') if isinstance(user_id, bytes) else user_id,
+                unpack_score(score))
+               for user_id, score in rankings]
+        if len(rankings) < chunk_size:
+            return
+        start += chunk_size
 
 
 def epoch_to_datetime(epoch: str) -> datetime:
@@ -0,0 +1,39 @@
+'''
+Daily reset off the request path.
+
+Every engine's next epoch is prepared RESET_LEAD secs before the reset
+and swapped in right at the reset, so requests only compare epochs.
+'''
+import asyncio
+
+from ..config import RESET_LEAD
+from .reset import get_current_epoch, get_next_epoch, seconds_til_next_reset
+
+
+# started by main.py lifespan
+async def run_reset_scheduler(engines: dict):
+    while True:
+        await asyncio.sleep(max(seconds_til_next_reset() - RESET_LEAD, 0))
+
+        next_epoch = get_next_epoch()
+        await _for_all(engines, lambda engine: engine.prepare(next_epoch))
+
+        # seconds_til_next_reset() rounds down, so poll the last sec
+        while get_current_epoch() != next_epoch:
+            await asyncio.sleep(max(seconds_til_next_reset(), 0.05))
+
+        # swaps in the prepared epoch and persists stats in the background
+        await _for_all(engines, lambda engine: engine.ensure_reset(next_epoch))
+
+
+async def _for_all(engines: dict, fn):
+    '''
+    Runs fn on every engine; one engine failing doesnt stop the others.
+    Requests fall back to resetting a failed engine themselves.
+    '''
+    game_ids = list(engines)
+    results = await asyncio.gather(*(fn(engines[g]) for g in game_ids),
+                                   return_exceptions=True)
+    for game_id, res in zip(game_ids, results):
+        if isinstance(res, Exception):
+            print(f'Reset scheduler failed for {game_id}: {res!r}')
@@ -0,0 +1,20 @@
+'''
+Lua scripts, registered once per process instead of per call.
+'''
+import redis.asyncio as Redis
+from redis.commands.core import AsyncScript
+
+
+# source -> script; sha1 hashed once, on 1st use
+_scripts: dict[str, AsyncScript] = {}
+
+
+async def run_script(redis: Redis, source: str, keys: list, args: list):
+    '''
+    EVALSHAs source on redis; loads it on the 1st NOSCRIPT.
+    '''
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = redis.register_script(source)
+    # any client works; the script only keeps its sha
+    return await script(keys=keys, args=args, client=redis)
@@ -1,3 +1,5 @@
+import os
+from pathlib import Path
 import pytest
 import pytest_asyncio
 from fastapi import FastAPI
@@ -6,6 +8,9 @@ from httpx import AsyncClient, ASGITransport
 from fakeredis import FakeAsyncRedis
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
+# serve puzzles offline so tests dont hit lichess; must be set before src loads
+os.environ['PUZZLE_CORPUS'] = str(Path(__file__).parent / 'data' / 'puzzles.csv')
+
 from src.main import app
 from src.db.models.stats import Base
 from src.depends.db_session import get_db_session
@@ -21,6 +26,29 @@ async def game_id():
     return 'chess_puzzle'
 
 
+# black to move: e8e1+ g1h2, then e1e2 (not a real lichess puzzle)
+@pytest.fixture
+def puzzle():
+    return {
+        'fen': '4r1k1/5ppp/8/8/8/7P/5PP1/6K1 b - - 1 1',
+        'solution': ['e8e1', 'g1h2', 'e1e2'],
+        'rating': 1500
+    }
+
+
+# engine w/o db; only for testing game logic
+@pytest_asyncio.fixture
+async def chess_engine(puzzle, redis_client):
+    from src.engines.chess_puzzle import ChessPuzzleEngine
+
+    async def fetcher(epoch):
+        return puzzle
+
+    engine = ChessPuzzleEngine('chess_puzzle', redis_client, None, fetcher)
+    await engine.ensure_reset('2025-12-22')
+    return engine
+
+
 @pytest_asyncio.fixture
 def event_loop():
     loop = asyncio.new_event_loop()
@@ -36,6 +64,10 @@ async def db_engine():
     )
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # start every test w/ empty tables; i.e. a newer day saved by
+        # another test would be returned by /daily instead of this test's
+        for table in reversed(Base.metadata.sorted_tables):
+            await conn.execute(table.delete())
     yield engine
 
 
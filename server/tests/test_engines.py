@@ -0,0 +1,431 @@
+from pathlib import Path
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_chess_answer_key(chess_engine, puzzle):
+    import chess
+
+    engine = chess_engine
+    board = chess.Board(puzzle['fen'])
+
+    for ply, solution_move in enumerate(puzzle['solution']):
+        state = {**engine.init_state(), 'fen': board.fen(), 'ply': ply, 'score': ply}
+
+        # house moves can be forced, so no wrong move
+        legal = [m.uci() for m in board.legal_moves]
+        wrong = [m for m in legal if m != solution_move][:1]
+        illegal = 'a1a8' if 'a1a8' not in legal else 'h8a1'
+
+        # fast path must match the python-chess path
+        for move in (solution_move, illegal, *wrong):
+            action = {'move': move}
+            assert engine.update_state(state, action) == engine._update_board(state, action)
+        assert engine.play_house_turn(state) == engine._play_house_turn_board(state)
+
+        board.push_uci(solution_move)
+
+    # non-canonical FEN falls back to python-chess
+    state = {**engine.init_state(), 'fen': puzzle['fen'].replace(' 1 1', ' 0 1')}
+    action = {'move': puzzle['solution'][0]}
+    assert engine.update_state(state, action) == engine._update_board(state, action)
+
+
+@pytest.mark.asyncio
+async def test_chess_position_cache(chess_engine, monkeypatch):
+    import src.engines.base
+
+    async def save_stats_to_db(*args):
+        pass
+    monkeypatch.setattr(src.engines.base, 'save_stats_to_db', save_stats_to_db)
+
+    engine = chess_engine
+    state = engine.init_state()
+
+    for _ in range(3):
+        r = engine.update_state(state, {'move': 'g8h8'})
+        assert r['wrong'] == True
+    r = engine.update_state(state, {'move': 'a1a8'})
+    assert r['illegal'] == True
+
+    stats = engine.positions.stats()
+    assert stats['misses'] == 1
+    assert stats['hits'] == 3
+
+    # new epoch clears it
+    await engine.ensure_reset('2025-12-23')
+    assert len(engine.positions) == 0
+
+
+@pytest.mark.asyncio
+async def test_prepared_reset(chess_engine, puzzle, monkeypatch):
+    import src.engines.base
+
+    saved = []
+    async def save_stats_to_db(game_id, prev_epoch, outof, *args):
+        saved.append((prev_epoch, outof))
+    monkeypatch.setattr(src.engines.base, 'save_stats_to_db', save_stats_to_db)
+
+    engine = chess_engine
+    next_puzzle = {**puzzle, 'rating': 2000}
+    async def fetcher(epoch):
+        return next_puzzle
+    engine._fetcher = fetcher
+
+    # scheduler prepares ahead; live epoch untouched
+    await engine.prepare('2025-12-23')
+    assert engine.rating == 1500
+
+    # reset is a swap, so fetcher is never awaited on the request path
+    async def fail(epoch):
+        raise AssertionError('fetched during reset')
+    engine._fetcher = fail
+    assert await engine.ensure_reset('2025-12-23') == True
+    assert engine.rating == 2000
+
+    # old or same epoch is a no-op
+    assert await engine.ensure_reset('2025-12-22') == False
+    assert await engine.ensure_reset('2025-12-23') == False
+
+    # prev epoch's stats are saved in the background
+    await engine.wait_persisted()
+    assert saved == [('2025-12-22', 2)]
+
+
+@pytest.mark.asyncio
+async def test_restart_checkpoint(chess_engine, redis_client, puzzle, monkeypatch):
+    import src.engines.base
+    from src.engines.chess_puzzle import ChessPuzzleEngine
+
+    saved = []
+    async def save_stats_to_db(game_id, prev_epoch, outof, *args):
+        saved.append((prev_epoch, outof))
+    monkeypatch.setattr(src.engines.base, 'save_stats_to_db', save_stats_to_db)
+    await chess_engine.wait_persisted()  # checkpoint of 2025-12-22
+
+    async def fail(epoch):
+        raise AssertionError('fetched on restart')
+
+    # restart in the same epoch: resumed from the checkpoint, no fetch
+    await redis_client.delete('engine:chess_puzzle:2025-12-22')
+    engine = ChessPuzzleEngine('chess_puzzle', redis_client, None, fail)
+    assert await engine.ensure_reset('2025-12-22') == True
+    assert engine.solution == puzzle['solution']
+    await engine.wait_persisted()
+    assert saved == []
+
+    # restart after the reset: last epoch's stats are still saved
+    async def fetcher(epoch):
+        return puzzle
+    engine = ChessPuzzleEngine('chess_puzzle', redis_client, None, fetcher)
+    assert await engine.ensure_reset('2025-12-23') == True
+    await engine.wait_persisted()
+    assert saved == [('2025-12-22', 2)]
+
+    checkpoint = await engine._load_checkpoint()
+    assert checkpoint['epoch'] == '2025-12-23'
+
+
+@pytest.mark.asyncio
+async def test_init_state_ref(chess_engine, redis_client):
+    import json
+    from src.depends.game_states import GameStateStore
+
+    engine = chess_engine
+    initial = engine.initial
+    assert initial.epoch == '2025-12-22'
+    assert json.loads(initial.body) == engine.render(engine.init_state())
+
+    # new player stores a ref, which decodes to the shared state
+    store = GameStateStore(redis_client, None, engine.codec, engine)
+    await store.store('chess_puzzle', 'u1', '2025-12-22', initial.ref, 60)
+    raw = await redis_client.hget('game:chess_puzzle:state:u1:2025-12-22', 'v')
+    assert raw == initial.ref
+    assert len(raw) < len(engine.codec.encode(engine.init_state()))
+    assert await store.get('chess_puzzle', 'u1', '2025-12-22') is initial.state
+
+    # moved states are encoded as usual
+    state = engine.update_state(initial.state, {'move': engine.solution[0]})
+    await store.store('chess_puzzle', 'u2', '2025-12-22', state, 60)
+    assert await store.get('chess_puzzle', 'u2', '2025-12-22') == state
+
+    # old epoch's ref no longer resolves
+    await engine.ensure_reset('2025-12-23')
+    assert engine.initial.epoch == '2025-12-23'
+    assert await store.get('chess_puzzle', 'u1', '2025-12-22') is None
+
+
+@pytest.mark.asyncio
+async def test_puzzle_queue(redis_client, puzzle):
+    import asyncio
+    from src.providers.prefetch import PuzzleQueue
+    from src.engines.chess_puzzle import ChessPuzzleEngine
+
+    fetched = []
+    async def fetch():
+        fetched.append(len(fetched))
+        return {**puzzle, 'id': str(len(fetched))}
+
+    queue = PuzzleQueue('chess_puzzle', redis_client, fetch, size=3)
+    assert await queue.fill() == 3
+    assert await queue.fill() == 0
+
+    # every worker gets the same puzzle for an epoch, popped once
+    workers = [ChessPuzzleEngine('chess_puzzle', redis_client, None, queue.pop)
+               for _ in range(4)]
+    await asyncio.gather(*(w.ensure_reset('2025-12-22') for w in workers))
+    assert {w.rating for w in workers} == {puzzle['rating']}
+    assert await redis_client.llen('puzzles:chess_puzzle:queue') == 2
+
+    # in fetch order
+    assert (await queue.pop())['id'] == '2'
+    assert (await queue.pop())['id'] == '3'
+    assert len(fetched) == 3
+
+    # empty queue falls back to fetching
+    assert (await queue.pop())['id'] == '4'
+    assert len(fetched) == 4
+
+
+@pytest.mark.asyncio
+async def test_puzzle_queue_fill_workers(redis_client, puzzle):
+    import asyncio
+    from src.providers.prefetch import PuzzleQueue
+
+    async def fetch():
+        await asyncio.sleep(0.05)  # slow provider
+        return puzzle
+
+    # every worker runs the filler; only 1 tops up, so no overshoot
+    workers = [PuzzleQueue('chess_puzzle', redis_client, fetch, size=3)
+               for _ in range(4)]
+    await redis_client.rpush('puzzles:chess_puzzle:queue', '{}')
+    added = await asyncio.gather(*(w.fill() for w in workers))
+    assert sorted(added) == [0, 0, 0, 2]
+    assert await redis_client.llen('puzzles:chess_puzzle:queue') == 3
+
+    # lease released once done
+    assert await workers[0].fill() == 0
+    await redis_client.lpop('puzzles:chess_puzzle:queue')
+    assert await workers[1].fill() == 1
+
+
+@pytest.mark.asyncio
+async def test_multi_worker_reset(redis_client, puzzle, monkeypatch):
+    import asyncio
+    import src.engines.base
+    from src.engines.chess_puzzle import ChessPuzzleEngine
+
+    saved = []
+    async def save_stats_to_db(game_id, prev_epoch, *args):
+        saved.append(prev_epoch)
+    monkeypatch.setattr(src.engines.base, 'save_stats_to_db', save_stats_to_db)
+
+    fetched = []
+    async def fetcher(epoch):
+        fetched.append(epoch)
+        await asyncio.sleep(0.2)  # slow provider
+        return {**puzzle, 'rating': len(fetched)}
+
+    # 1 engine per worker process, sharing redis
+    workers = [ChessPuzzleEngine('chess_puzzle', redis_client, None, fetcher)
+               for _ in range(4)]
+
+    for epoch in ('2025-12-22', '2025-12-23'):
+        await asyncio.gather(*(w.ensure_reset(epoch) for w in workers))
+
+        # 1 fetch per epoch, same puzzle everywhere
+        assert fetched[-1] == epoch
+        assert len({w.rating for w in workers}) == 1
+    assert len(fetched) == 2
+
+    # 1 save of the prev epoch
+    await asyncio.gather(*(w.wait_persisted() for w in workers))
+    assert saved == ['2025-12-22']
+
+
+def test_puzzle_corpus(tmp_path, puzzle):
+    from src.providers.corpus import PuzzleCorpus, group_for
+
+    src = Path(__file__).parent / 'data' / 'puzzles.csv'
+    header, row = src.read_text().splitlines()
+
+    # same position at different ratings, plus a broken row
+    rows = [row.replace('test1,', f'p{i},').replace(',1500,', f',{1500 + 100 * (i % 2)},')
+            for i in range(20)]
+    rows.insert(5, 'bad,8/8/8/8/8/8/8/8 w - - 0 1,a1a2 a2a3,1500,75,90,1,mate,,')
+    path = tmp_path / 'puzzles.csv'
+    path.write_text('\n'.join([header, *rows]) + '\n')
+
+    corpus = PuzzleCorpus(path)
+    assert corpus.count() == 21
+    assert corpus.count(group_for(rating=1650)) == 10
+    assert corpus.count(group_for(theme='endgame')) == 20
+
+    # converted to the player's turn
+    picked = corpus.pick('2025-12-22')
+    assert picked['fen'] == puzzle['fen']
+    assert picked['solution'] == puzzle['solution']
+
+    # seeded by epoch, and stable across reopening
+    assert PuzzleCorpus(path).pick('2025-12-22') == picked
+    ids = {corpus.pick(f'2025-12-{d:02}')['id'] for d in range(1, 29)}
+    assert len(ids) > 1 and 'bad' not in ids
+    assert corpus.pick('2025-12-22', 'band:1600')['rating'] == 1600
+
+    # stale index is rebuilt when the CSV changes
+    path.write_text('\n'.join([header, row]) + '\n')
+    assert PuzzleCorpus(path).count() == 1
+
+
+@pytest.mark.asyncio
+async def test_minesweeper(redis_client):
+    import numpy as np
+    from src.engines.minesweeper import MinesweeperEngine, HIDDEN, MINE
+
+    engine = MinesweeperEngine('minesweeper', redis_client, None, ndim=8, nmines=10)
+    await engine.ensure_reset('2025-12-22')
+
+    # seeded: every worker and restart gets the same board
+    assert engine.init_mines('2025-12-22') == engine.init_mines('2025-12-22')
+    assert engine.init_mines('2025-12-22') != engine.init_mines('2025-12-23')
+    assert int(engine.mines.sum()) == 10
+
+    # counts match a brute force count
+    grid = engine.mines.reshape(8, 8)
+    for r in range(8):
+        for c in range(8):
+            around = grid[max(r - 1, 0):r + 2, max(c - 1, 0):c + 2].sum() - grid[r, c]
+            assert engine.counts[r * 8 + c] == around
+
+    # state is just 2 bitsets
+    state = engine.init_state()
+    assert len(engine.codec.encode(state)) < 16
+
+    # revealing a zero tile opens its region
+    zero = int(np.flatnonzero((engine.counts == 0) & ~engine.mines)[0])
+    state = engine.update_state(state, {'reveal': zero})
+    board = engine.render(state)['board']
+    assert board[zero] == 0
+    assert sum(t != HIDDEN for t in board) > 1
+    assert engine.update_state(state, {'reveal': zero})['illegal'] == True
+
+    # only revealed safe tiles score
+    assert state['score'] == sum(t != HIDDEN for t in board)
+    mine = int(np.flatnonzero(engine.mines)[0])
+    flagged = engine.update_state(state, {'flag': mine})
+    assert flagged['score'] == state['score']
+    state = flagged
+    assert engine.update_state(state, {'reveal': mine})['illegal'] == True
+    assert engine.update_state(state, {'reveal': 64})['illegal'] == True
+
+    # revealing every safe tile wins
+    won = state
+    for tile in np.flatnonzero(~engine.mines):
+        if not won['gameover'] and not int(won['revealed'], 16) >> int(tile) & 1:
+            won = engine.update_state(won, {'reveal': int(tile)})
+    assert won['won'] == True
+    assert won['score'] == engine.get_outof_metric() == 54
+
+    # revealing a mine loses
+    other = int(np.flatnonzero(engine.mines)[1])
+    lost = engine.update_state(state, {'reveal': other})
+    assert lost['gameover'] == True and lost['won'] == False
+    assert engine.render(lost)['board'][other] == MINE
+
+
+@pytest.mark.asyncio
+async def test_minesweeper_flag_everything(redis_client):
+    from src.engines.minesweeper import MinesweeperEngine
+
+    engine = MinesweeperEngine('minesweeper', redis_client, None, ndim=8, nmines=10)
+    await engine.ensure_reset('2025-12-22')
+
+    # flagging every tile must not score (it would rank as a perfect game)
+    state = engine.init_state()
+    for tile in range(64):
+        state = engine.update_state(state, {'flag': tile})
+    assert state['score'] == 0
+    assert state['gameover'] == False
+
+
+@pytest.mark.parametrize('ndim,nmines', [(8, 10), (8, 0), (8, 64), (30, 100)])
+def test_minesweeper_regions(ndim, nmines):
+    from src.engines.minesweeper import MinesweeperEngine
+
+    engine = MinesweeperEngine('minesweeper', None, None, ndim=ndim, nmines=nmines)
+    engine.apply_epoch({'mines': engine.init_mines('2025-12-22')})
+
+    # precomputed reveal == BFS flood fill for every safe tile
+    for tile in range(ndim * ndim):
+        if not engine.mines[tile]:
+            assert engine._reveal(tile) == engine._flood_fill(tile)
+
+
+def test_lazy_engine_registry():
+    import subprocess
+    import sys
+    from src.depends.engine_reg import ENGINES, get_engine_spec, resolve
+    from src.engines.minesweeper import MinesweeperEngine
+
+    # app imports no engine deps until init_game_engine
+    probe = ('import sys, src.main; '
+             'print(any(m in sys.modules for m in ("chess", "numpy")))')
+    out = subprocess.run([sys.executable, '-c', probe], capture_output=True,
+                         text=True, check=True, cwd=Path(__file__).parents[1])
+    assert out.stdout.strip() == 'False'
+
+    assert get_engine_spec('minesweeper') is ENGINES['minesweeper']
+    assert get_engine_spec('no_such_game') is None
+    assert resolve(ENGINES['minesweeper']['engine']) is MinesweeperEngine
+    assert resolve('src.engines.minesweeper:MinesweeperEngine') is MinesweeperEngine
+    assert resolve(MinesweeperEngine) is MinesweeperEngine
+    assert resolve(None) is None
+
+
+@pytest.mark.asyncio
+async def test_engine_warmup(redis_client, puzzle, monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+    from src.depends import engine_reg
+    from src.engines.chess_puzzle import ChessPuzzleEngine
+
+    calls = []
+    async def provider(http_client, epoch=None):
+        calls.append(epoch)
+        return puzzle
+
+    async def slow_provider(http_client, epoch=None):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(engine_reg, 'ENGINES', {
+        'fast': {'engine': ChessPuzzleEngine, 'provider': provider},
+        'slow': {'engine': ChessPuzzleEngine, 'provider': slow_provider},
+    })
+    state = SimpleNamespace(redis=redis_client, db_session_factory=None, http=None,
+                            engines={}, ready={}, warmups=set(), puzzle_queues={})
+    app = SimpleNamespace(state=state)
+
+    # both run at once; the slow one times out but is still served
+    hot = await asyncio.gather(engine_reg.start_game_engine('fast', app, timeout=0.5),
+                               engine_reg.start_game_engine('slow', app, timeout=0.5))
+    assert hot == [True, False]
+    assert state.ready == {'fast': True, 'slow': False}
+    assert set(state.engines) == {'fast', 'slow'}
+    assert len(state.warmups) == 1
+
+    # warm engine has its epoch live and the solution's positions cached
+    engine = state.engines['fast']
+    assert len(calls) == 1
+    assert engine.positions.get(engine.line[-1]) is not None
+
+    for task in state.warmups:
+        task.cancel()
+
+    # an engine that cant even be built aborts startup instead of 404ing
+    monkeypatch.setattr(engine_reg, 'ENGINES', {
+        'broken': {'engine': '.engines.missing:MissingEngine'},
+    })
+    with pytest.raises(ImportError):
+        await engine_reg.start_game_engine('broken', app, timeout=0.5)
+    assert 'broken' not in state.engines
@@ -158,3 +158,256 @@ async def test_wrong_move(game_id, client, redis_client):
     assert state['wrong'] == True
 
 
+
+@pytest.mark.asyncio
+async def test_redis_round_trips(game_id, client, redis_client):
+    import json
+
+    session_id = "testsession789"
+    user_info = {'user_id': "user5"}
+    await redis_client.set(f"session:{session_id}", json.dumps(user_info))
+    headers = {"Cookie": f"session_id={session_id}"}
+
+    r = await client.get(f"/games/{game_id}/start", headers=headers)
+    assert r.status_code == 200
+    assert int(r.headers['X-Redis-Round-Trips']) <= 2
+    state = r.json()
+
+    payload = {'state': state, 'action': {'move': 'e8e1'}}
+    r = await client.post(f"/games/{game_id}/update", json=payload, headers=headers)
+    assert r.status_code == 200
+    assert int(r.headers['X-Redis-Round-Trips']) <= 2
+    state = r.json()
+
+    r = await client.post(f"/games/{game_id}/house_turn", json={'state': state}, headers=headers)
+    assert r.status_code == 200
+    assert int(r.headers['X-Redis-Round-Trips']) <= 2
+
+    # restart returns the stored state instead of a new one
+    r = await client.get(f"/games/{game_id}/start", headers=headers)
+    assert r.json()['ply'] == 2
+
+
+@pytest.mark.asyncio
+async def test_server_state(game_id, client, redis_client, monkeypatch):
+    import json
+    import src.api.games
+
+    session_id = "testsession790"
+    user_info = {'user_id': "user6"}
+    await redis_client.set(f"session:{session_id}", json.dumps(user_info))
+    headers = {"Cookie": f"session_id={session_id}"}
+
+    r = await client.get(f"/games/{game_id}/start", headers=headers)
+    init_state = r.json()
+
+    # no state sent, so server loads it
+    r = await client.post(f"/games/{game_id}/update",
+                          json={'action': {'move': 'e8e1'}},
+                          headers=headers)
+    assert r.status_code == 200
+    assert r.json()['ply'] == 1
+
+    # forged states are ignored in SERVER_STATE mode
+    monkeypatch.setattr(src.api.games, 'SERVER_STATE', True)
+    forged = {**init_state, 'ply': 1, 'score': 99}
+    r = await client.post(f"/games/{game_id}/house_turn",
+                          json={'state': forged},
+                          headers=headers)
+    assert r.status_code == 200
+    state = r.json()
+    assert state['house_move'] == 'g1h2'
+    assert state['score'] == 1
+
+
+def test_state_codec():
+    import json
+    from src.engines.chess_puzzle import ChessPuzzleEngine
+
+    codec = ChessPuzzleEngine.codec
+    state = {
+        'piece': 'b',
+        'rating': 1500,
+        'fen': '4r1k1/5ppp/8/8/8/7P/5PP1/6K1 b - - 1 1',
+        'ply': 0,
+        'score': 0,
+        'gameover': False
+    }
+
+    raw = codec.encode(state)
+    assert len(raw) < len(json.dumps(state))
+    assert codec.decode(raw) == state
+
+    # one-off flags survive
+    assert codec.decode(codec.encode({**state, 'wrong': True}))['wrong'] == True
+
+    # values stored before codecs are still JSON
+    assert codec.decode(json.dumps(state).encode('utf-8')) == state
+
+
+@pytest.mark.asyncio
+async def test_game_ws(game_id, client, redis_client):
+    import json
+    from starlette.testclient import TestClient
+    from src.main import app
+
+    await redis_client.set("session:testsessionws", json.dumps({'user_id': "user7"}))
+
+    # no 'with': lifespan is already run by the client fixture
+    ws_client = TestClient(app)
+    ws_client.cookies.set('session_id', 'testsessionws')
+    with ws_client.websocket_connect(f'/games/{game_id}/ws') as ws:
+        ws.send_json({'type': 'start'})
+        assert ws.receive_json()['state']['ply'] == 0
+
+        # house reply is pushed w/o asking
+        ws.send_json({'type': 'update', 'action': {'move': 'e8e1'}})
+        assert ws.receive_json()['state']['ply'] == 1
+        reply = ws.receive_json()
+        assert reply['type'] == 'house_turn'
+        assert reply['state']['ply'] == 2
+
+        ws.send_json({'type': 'nope'})
+        assert ws.receive_json()['status'] == 400
+
+        # bad frames dont close the socket
+        ws.send_text('not json')
+        assert ws.receive_json()['status'] == 422
+        ws.send_json(['not', 'a', 'dict'])
+        assert ws.receive_json()['status'] == 422
+        ws.send_json({'type': 'start'})
+        assert ws.receive_json()['state']['ply'] == 2
+
+
+@pytest.mark.asyncio
+async def test_actions_cold_cache(game_id, client, redis_client):
+    import json
+    from src.main import app
+
+    session_id = "testsessioncold"
+    await redis_client.set(f"session:{session_id}", json.dumps({'user_id': "user9"}))
+    headers = {"Cookie": f"session_id={session_id}"}
+
+    r = await client.get(f"/games/{game_id}/start", headers=headers)
+    assert r.status_code == 200
+
+    # i.e. another worker: session + state read in 1 round trip, then the commit
+    app.state.session_cache.clear()
+    app.state.state_cache.clear()
+    payload = {'actions': [{'move': 'e8e1'}]}
+    r = await client.post(f"/games/{game_id}/actions", json=payload, headers=headers)
+    assert r.status_code == 200
+    assert int(r.headers['X-Redis-Round-Trips']) == 2
+    assert r.json()['state']['ply'] == 2
+
+    app.state.session_cache.clear()
+    app.state.state_cache.clear()
+    payload = {'actions': [{'move': 'e1e2'}]}
+    r = await client.post(f"/games/{game_id}/actions", json=payload, headers=headers)
+    assert r.status_code == 200
+    assert int(r.headers['X-Redis-Round-Trips']) == 2
+    assert r.json()['state']['gameover'] == True
+
+
+@pytest.mark.asyncio
+async def test_game_actions(game_id, client, redis_client):
+    import json
+
+    session_id = "testsessionbatch"
+    await redis_client.set(f"session:{session_id}", json.dumps({'user_id': "user8"}))
+    headers = {"Cookie": f"session_id={session_id}"}
+
+    r = await client.get(f"/games/{game_id}/start", headers=headers)
+    assert r.status_code == 200
+
+    # both moves + the house reply in between, 1 write
+    payload = {'actions': [{'move': 'e8e1'}, {'move': 'e1e2'}]}
+    r = await client.post(f"/games/{game_id}/actions", json=payload, headers=headers)
+    assert r.status_code == 200
+    assert int(r.headers['X-Redis-Round-Trips']) <= 2
+    body = r.json()
+    assert [s['ply'] for s in body['steps']] == [1, 2, 3]
+    assert body['steps'][1]['house_move'] == 'g1h2'
+    assert body['state']['gameover'] == True
+
+    # stored state is the final one
+    r = await client.get(f"/games/{game_id}/start", headers=headers)
+    assert r.json()['ply'] == 3
+
+    r = await client.post(f"/games/{game_id}/actions", json={'actions': []}, headers=headers)
+    assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_ready(game_id, client):
+    # lifespan warms every engine before serving
+    r = await client.get("/ready")
+    assert r.status_code == 200
+    assert r.json()['engines'][game_id] is True
+
+
+@pytest.mark.asyncio
+async def test_state_commit(redis_client):
+    from src.depends.game_states import GameStateStore
+    from src.services.cache import LRUCache
+    from src.services.leaderboard import leaderboard_key, rank_args, unpack_score
+
+    game_id, epoch = 'chess_puzzle', '2025-12-22'
+    store = GameStateStore(redis_client, LRUCache(10))
+    rank = rank_args(game_id, 'u1', epoch, 1)
+
+    # 1st write expects seq 0; state, seq and score land together
+    assert await store.commit(game_id, 'u1', epoch, {'ply': 1}, 60, 0, rank) == 1
+    assert await store.fetch(game_id, 'u1', epoch) == ({'ply': 1}, 1)
+    score = await redis_client.zscore(leaderboard_key(game_id, epoch), 'u1')
+    assert unpack_score(score) == 1
+
+    # 2nd tab still on seq 0 is rejected and nothing is written
+    assert await store.commit(game_id, 'u1', epoch, {'ply': 9}, 60, 0) is None
+    assert await store.get(game_id, 'u1', epoch) == {'ply': 1}
+
+    # no seq: written as is (client-sent states)
+    assert await store.commit(game_id, 'u1', epoch, {'ply': 2}, 60) == 2
+    assert store.get_cached(game_id, 'u1', epoch) == ({'ply': 2}, 2)
+    # seq lives in the state's hash, so 1 key w/ 1 ttl per state
+    assert await redis_client.hgetall(f'game:{game_id}:state:u1:{epoch}') == {b'v': b'{"ply":2}', b's': b'2'}
+    assert 0 < await redis_client.ttl(f'game:{game_id}:state:u1:{epoch}') <= 60
+
+
+@pytest.mark.asyncio
+async def test_chess_leaderboard(game_id, client, redis_client, db_session_factory):
+    import json
+    from src.services.reset import get_current_epoch
+    from src.services.save import save_stats_to_db
+
+    async def login(user_id):
+        await redis_client.set(f"session:s{user_id}", json.dumps({'user_id': user_id}))
+        headers = {"Cookie": f"session_id=s{user_id}"}
+        await client.get(f"/games/{game_id}/start", headers=headers)
+        return headers
+
+    async def play(headers, *moves):
+        payload = {'actions': [{'move': m} for m in moves]}
+        r = await client.post(f"/games/{game_id}/actions", json=payload, headers=headers)
+        return r.json()['state']
+
+    # perfect solve scores every player move
+    solver = await login('solver')
+    state = await play(solver, 'e8e1', 'e1e2')
+    assert state['gameover'] == True and state['score'] == 2
+
+    # a wrong move later doesnt lower the best score
+    other = await login('other')
+    assert (await play(other, 'e8e1'))['score'] == 1
+    assert (await play(other, 'g8h8'))['score'] == 0
+
+    r = await client.get(f"/games/{game_id}/leaderboard", headers=other)
+    assert r.json()['top'] == [{'rank': 1, 'user_id': 'solver', 'score': 2},
+                               {'rank': 2, 'user_id': 'other', 'score': 1}]
+
+    # persisted the same way
+    await save_stats_to_db(game_id, get_current_epoch(), 2,
+                           redis_client, db_session_factory)
+    r = await client.get(f'/api/stats/{game_id}/daily')
+    assert r.json()['rankings'] == [{'user_id': 'solver', 'score': 2},
+                                    {'user_id': 'other', 'score': 1}]
@@ -0,0 +1,129 @@
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_session_cache(redis_client):
+    from src.depends.sessions import SessionManager
+    from src.services.cache import LRUCache
+
+    sessions = SessionManager(redis_client, cache=LRUCache(10, ttl=5))
+    await sessions.create('s1', 'user1')
+
+    # written thru, so no redis read
+    await redis_client.delete('session:s1')
+    assert (await sessions.get('s1'))['user_id'] == 'user1'
+
+    # expired heartbeat drops it from the cache
+    assert await sessions.heartbeat('s1') == False
+    assert await sessions.get('s1') == None
+
+
+@pytest.mark.asyncio
+async def test_fetch_with_state(redis_client):
+    import json
+    from src.depends.sessions import SessionManager
+
+    sessions = SessionManager(redis_client)
+    await redis_client.hset('game:g:user1:e', mapping={'v': b'state', 's': 3})
+
+    # msgpack (codec) and legacy JSON sessions
+    await sessions.create('s1', 'user1')
+    await redis_client.set('session:s2', json.dumps({'user_id': 'user1'}))
+    for session_id in ('s1', 's2'):
+        session, user_id, state, seq = await sessions.fetch_with_state(
+                session_id, 'game:g:', ':e')
+        assert session['user_id'] == user_id == 'user1'
+        assert (state, seq) == (b'state', b'3')
+
+    # long ids are str8 in msgpack
+    await sessions.create('s3', 'u' * 40)
+    session, user_id, state, seq = await sessions.fetch_with_state('s3', 'game:g:', ':e')
+    assert session['user_id'] == user_id == 'u' * 40
+    assert (state, seq) == (None, None)
+
+    assert await sessions.fetch_with_state('nope', 'game:g:', ':e') == (None, None, None, None)
+
+    # other codec versions arent parsed in lua; caller reads the state itself
+    from src.services.codec import MsgpackCodec
+    await redis_client.set('session:s4', MsgpackCodec(('user_id', 'x'), 2).encode({'user_id': 'user1'}))
+    sessions.codec = MsgpackCodec(('user_id', 'x'), 2)
+    session, user_id, state, seq = await sessions.fetch_with_state('s4', 'game:g:', ':e')
+    assert session['user_id'] == 'user1'
+    assert (user_id, state, seq) == (None, None, None)
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_batching(redis_client, monkeypatch):
+    import asyncio
+    from src.depends.sessions import SessionManager, HeartbeatBatcher
+
+    pipelines = []
+    pipeline = redis_client.pipeline
+    def counting_pipeline(*args, **kwargs):
+        pipelines.append(1)
+        return pipeline(*args, **kwargs)
+    monkeypatch.setattr(redis_client, 'pipeline', counting_pipeline)
+
+    sessions = SessionManager(redis_client, ttl=60,
+                              heartbeats=HeartbeatBatcher(redis_client, 60))
+    for i in range(5):
+        await sessions.create(f's{i}', f'user{i}', ttl=10)
+
+    # same tick -> 1 pipeline
+    beats = await asyncio.gather(*(sessions.heartbeat(f's{i}') for i in range(6)))
+    assert beats == [True] * 5 + [False]
+    assert len(pipelines) == 1
+    assert await redis_client.ttl('session:s0') > 10
+
+    await sessions.heartbeat('s0')
+    assert len(pipelines) == 2
+
+
+@pytest.mark.asyncio
+async def test_token_sessions(redis_client, monkeypatch):
+    import time
+    from src.depends.sessions import TokenSessionManager
+
+    sessions = TokenSessionManager(redis_client, 'secret', ttl=60)
+    token = await sessions.new_session('user1')
+
+    # no redis needed to check it
+    assert sessions.get_cached(token) == {'user_id': 'user1'}
+    assert await redis_client.dbsize() == 0
+
+    # tampered or signed w/ another secret
+    payload, sig = token.split('.')
+    assert sessions.get_cached(payload + 'x.' + sig) == None
+    assert TokenSessionManager(redis_client, 'other').get_cached(token) == None
+    assert sessions.get_cached('garbage') == None
+
+    # heartbeat re-issues the same session w/ a later expiry
+    assert await sessions.heartbeat(token) == True
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now + 30)
+    renewed = sessions.reissue(token)
+    assert sessions.verify(renewed)['jti'] == sessions.verify(token)['jti']
+    assert sessions.verify(renewed)['exp'] > sessions.verify(token)['exp']
+
+    # expired
+    monkeypatch.setattr(time, 'time', lambda: now + 61)
+    assert sessions.get_cached(token) == None
+    assert sessions.get_cached(renewed) == {'user_id': 'user1'}
+
+    # revoking covers every copy once they heartbeat
+    await sessions.revoke(renewed)
+    assert await sessions.heartbeat(renewed) == False
+
+
+@pytest.mark.asyncio
+async def test_token_sessions_need_secret(redis_client, monkeypatch):
+    import src.main
+    from asgi_lifespan import LifespanManager
+
+    # refuses to boot instead of failing every request
+    monkeypatch.setattr(src.main, 'SESSION_BACKEND', 'token')
+    monkeypatch.setattr(src.main, 'SESSION_SECRET', None)
+    monkeypatch.setattr(src.main.app.state, 'redis', redis_client, raising=False)
+    with pytest.raises(ValueError):
+        async with LifespanManager(src.main.app):
+            pass
@@ -1,14 +1,23 @@
 import pytest
 
 
+async def mark_played(game_id, redis):
+    # what GameContext.mark_played queues on /start
+    from src.services.reset import get_current_epoch
+    from src.depends.streak import queue_mark_played
+
+    pipe = redis.pipeline(transaction=True)
+    queue_mark_played(pipe, game_id, get_current_epoch())
+    await pipe.execute()
+
+
 @pytest.mark.asyncio
 async def test_streak_incr(game_id, redis_client):
     from src.services.reset import get_current_epoch
-    from src.depends.streak import mark_played, incr_streak
+    from src.depends.streak import incr_streak
 
     epoch = get_current_epoch()
     guard_key = f'game:{game_id}:played:{epoch}'
-    lplayed_key = f'game:{game_id}:last_played_epoch'
     streak_key = f'game:{game_id}:streak'
 
     # ensure streak key is clean
@@ -19,13 +28,11 @@ async def test_streak_incr(game_id, redis_client):
     # 1st play of the day
     await mark_played(game_id, redis_client)
     assert int(await redis_client.get(guard_key)) == 1
-    assert (await redis_client.get(lplayed_key)).decode('utf-8') == epoch
 
     # other users play
     await mark_played(game_id, redis_client)
     await mark_played(game_id, redis_client)
     assert int(await redis_client.get(guard_key)) == 1
-    assert (await redis_client.get(lplayed_key)).decode('utf-8') == epoch
 
     await incr_streak(game_id, epoch, redis_client)
     streak = int(await redis_client.get(streak_key))
@@ -41,16 +48,14 @@ async def test_streak_incr(game_id, redis_client):
 @pytest.mark.asyncio
 async def test_streak_reset(game_id, redis_client):
     from src.services.reset import get_current_epoch
-    from src.depends.streak import mark_played, incr_streak
+    from src.depends.streak import incr_streak
 
     epoch = '2025-12-22'
     guard_key = f'game:{game_id}:played:{epoch}'
-    lplayed_key = f'game:{game_id}:last_played_epoch'
     streak_key = f'game:{game_id}:streak'
 
     # mock mark_played for prev day
     await redis_client.set(guard_key, 1)
-    await redis_client.set(lplayed_key, epoch)
 
     # mock save_stats_to_db()
     await incr_streak(game_id, epoch, redis_client)
@@ -76,7 +81,7 @@ async def test_streak_reset(game_id, redis_client):
 
     # someone played
     await mark_played(game_id, redis_client)
-    assert (await redis_client.get(lplayed_key)).decode('utf-8') == epoch
+    assert int(await redis_client.get(guard_key)) == 1
 
     # today reset
     await incr_streak(game_id, epoch, redis_client)
@@ -105,11 +110,11 @@ async def test_stats_endpoint(game_id, client, redis_client, db_session_factory)
         db_session_factory=db_session_factory,
     )
 
-    # Should be sorted ascending for chess
+    # Should be sorted descending for chess (score = correct - wrong moves)
     expected_order = [
-            {'user_id': 'user3', 'score': 2},
+            {'user_id': 'user2', 'score': 5},
             {'user_id': 'user1', 'score': 3},
-            {'user_id': 'user2', 'score': 5}
+            {'user_id': 'user3', 'score': 2}
     ]
 
     r = await client.get(f'/api/stats/{game_id}/daily')
@@ -122,3 +127,150 @@ async def test_stats_endpoint(game_id, client, redis_client, db_session_factory)
     assert stats['streak'] == 0  # not 1 bc haven't mark_played, so no played key
 
 
+
+    # paged by rank
+    r = await client.get(f'/api/stats/{game_id}/daily', params={'limit': 2})
+    stats = r.json()
+    assert stats['rankings'] == expected_order[:2]
+    assert stats['players'] == 3
+    assert stats['next'] == 2
+
+    r = await client.get(f'/api/stats/{game_id}/daily', params={'after': stats['next']})
+    stats = r.json()
+    assert stats['rankings'] == expected_order[2:]
+    assert stats['next'] == None
+
+
+@pytest.mark.asyncio
+async def test_iter_rankings(redis_client):
+    from src.services.save import iter_rankings
+    from src.services.leaderboard import pack_score
+
+    key = 'game:minesweeper:leaderboard:2025-12-22'
+    await redis_client.zadd(key, {f'user{i}': pack_score(i, 0, True) for i in range(25)})
+
+    chunks = [chunk async for chunk in iter_rankings(key, 'desc', redis_client, chunk_size=10)]
+    assert [len(c) for c in chunks] == [10, 10, 5]
+    assert chunks[0][0] == ('user24', 24)
+    assert chunks[-1][-1] == ('user0', 0)
+
+    chunks = [chunk async for chunk in iter_rankings(key, 'asc', redis_client, chunk_size=5)]
+    assert len(chunks) == 5
+    assert chunks[0][0] == ('user0', 0)
+
+
+@pytest.mark.asyncio
+async def test_stats_history(game_id, client, redis_client, db_session_factory):
+    from src.services.leaderboard import rank_player
+    from src.services.save import save_stats_to_db
+
+    epochs = [f'2025-11-{d:02}' for d in range(1, 6)]
+    for i, epoch in enumerate(epochs):
+        await rank_player(game_id, 'user1', epoch, i, redis_client)
+        await save_stats_to_db(game_id, epoch, i + 1, redis_client, db_session_factory)
+
+    # each epoch kept, newest first
+    r = await client.get(f'/api/stats/{game_id}/history',
+                         params={'since': epochs[0], 'until': epochs[-1], 'limit': 3})
+    assert r.status_code == 200
+    page = r.json()
+    assert [d['date'] for d in page['days']] == epochs[:1:-1]
+    assert page['days'][0]['outof'] == 5
+    assert page['next'] == epochs[2]
+
+    r = await client.get(f'/api/stats/{game_id}/history',
+                         params={'since': epochs[0], 'before': page['next']})
+    page = r.json()
+    assert [d['date'] for d in page['days']] == epochs[1::-1]
+    assert page['next'] == None
+
+
+@pytest.mark.asyncio
+async def test_stats_cache(game_id, client, redis_client, db_session_factory):
+    from src.services.reset import get_prev_epoch
+    from src.services.leaderboard import rank_player
+    from src.services.save import save_stats_to_db
+
+    epoch = get_prev_epoch()
+    await rank_player(game_id, 'user1', epoch, 1, redis_client)
+    await save_stats_to_db(game_id, epoch, 3, redis_client, db_session_factory)
+
+    r = await client.get(f'/api/stats/{game_id}/daily')
+    assert r.status_code == 200
+    assert r.json()['date'] == epoch
+    etag = r.headers['etag']
+    assert 'max-age' in r.headers['cache-control']
+
+    # unchanged -> 304 w/o a body
+    r = await client.get(f'/api/stats/{game_id}/daily', headers={'If-None-Match': etag})
+    assert r.status_code == 304
+    assert r.content == b''
+
+    # re-saving invalidates it (leaderboard is deleted after saving)
+    await rank_player(game_id, 'user1', epoch, 1, redis_client)
+    await rank_player(game_id, 'user2', epoch, 2, redis_client)
+    await save_stats_to_db(game_id, epoch, 3, redis_client, db_session_factory)
+    r = await client.get(f'/api/stats/{game_id}/daily', headers={'If-None-Match': etag})
+    assert r.status_code == 200
+    assert r.headers['etag'] != etag
+    assert r.json()['players'] == 2
+
+
+@pytest.mark.asyncio
+async def test_read_leaderboard(redis_client):
+    from src.services.leaderboard import rank_player, read_leaderboard
+
+    epoch = '2025-12-22'
+    for i in range(10):
+        await rank_player('minesweeper', f'user{i}', epoch, i, redis_client)
+
+    # desc: user9 is 1st
+    board = await read_leaderboard('minesweeper', 'user5', epoch, 3, 2, True, redis_client)
+    assert [e['user_id'] for e in board['top']] == ['user9', 'user8', 'user7']
+    assert board['rank'] == 5
+    assert [e['rank'] for e in board['around']] == [3, 4, 5, 6, 7]
+    assert board['around'][2] == {'rank': 5, 'user_id': 'user5', 'score': 5}
+    assert board['players'] == 10
+
+    # edge of the board, top skipped
+    board = await read_leaderboard('minesweeper', 'user0', epoch, 0, 2, False, redis_client)
+    assert board['top'] == None
+    assert board['rank'] == 1
+    assert [e['user_id'] for e in board['around']] == ['user0', 'user1', 'user2']
+
+    # not ranked yet
+    board = await read_leaderboard('minesweeper', 'nobody', epoch, 1, 2, False, redis_client)
+    assert board['rank'] == None
+    assert board['around'] == []
+
+
+@pytest.mark.asyncio
+async def test_packed_scores(redis_client, monkeypatch):
+    import src.services.leaderboard as lb
+
+    epoch = '2025-12-22'
+    key = lb.leaderboard_key('minesweeper', epoch)
+
+    # negative scores keep their order too
+    for score in (-3, 0, 5):
+        for elapsed in (0, 1000, lb.TIE_MAX):
+            for desc in (True, False):
+                assert lb.unpack_score(lb.pack_score(score, elapsed, desc)) == score
+
+    # same score: whoever got there 1st ranks higher
+    elapsed = 100
+    monkeypatch.setattr(lb, 'seconds_since_reset', lambda: elapsed)
+    await lb.rank_player('minesweeper', 'late', epoch, 5, redis_client)
+    elapsed = 50
+    await lb.rank_player('minesweeper', 'early', epoch, 5, redis_client)
+    board = await lb.read_leaderboard('minesweeper', 'late', epoch, 2, 0, True, redis_client)
+    assert [e['user_id'] for e in board['top']] == ['early', 'late']
+
+    # only improvements are written (desc: higher is better)
+    elapsed = 200
+    await lb.rank_player('minesweeper', 'early', epoch, 4, redis_client)
+    await lb.rank_player('minesweeper', 'early', epoch, 5, redis_client)
+    assert lb.unpack_score(await redis_client.zscore(key, 'early')) == 5
+    assert await redis_client.zrevrank(key, 'early') == 0
+    await lb.rank_player('minesweeper', 'late', epoch, 6, redis_client)
+    assert await redis_client.zrevrank(key, 'late') == 0